@@ -0,0 +1,105 @@
+"""Check compare_suite.py with tiny random models on CPU: batching changes speed but not answers.
+
+Usage: python benchmarks/compare_check.py [--prompts 12] [--batch-size 4] [--max-new-tokens 32]
+
+Every model in MODEL_INFO is replaced by a tiny LLaMA. The suite runs twice
+with greedy decoding, once one prompt at a time and once in left-padded
+batches. The check fails if any response differs between the runs, or if a
+model was loaded more than once. It prints both runs' tokens per second and
+the start of the Markdown report.
+
+A last batched run makes each model stop at a token its rows generate at
+different steps. It fails unless a row that stops earlier reports a lower
+latency than a longer row of the same batch.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tiny_model import tiny_model
+from model_pool import ModelPool
+from compare_suite import run_suite, write_json, write_markdown
+from main import MODEL_INFO
+
+WORDS = "the quick brown fox jumps over a lazy dog while models compare their answers".split()
+
+
+def stop_token(tokenizer, model, prompts, max_new_tokens):
+    """A token the greedy answers first produce at the most different steps, to use as end of sequence."""
+    tokenizer.padding_side = "left"
+    inputs = tokenizer(prompts, return_tensors="pt", padding=True)
+    with torch.inference_mode():
+        outputs = model.generate(**inputs, max_new_tokens=max_new_tokens, do_sample=False,
+                                 pad_token_id=tokenizer.pad_token_id)
+    first_steps = {}
+    for n, row in enumerate(outputs[:, inputs.input_ids.shape[1]:].tolist()):
+        for step, token in enumerate(row):
+            first_steps.setdefault(token, {}).setdefault(n, step)
+    return max(first_steps, key=lambda token: len(set(first_steps[token].values())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=12)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--max-new-tokens", type=int, default=32)
+    args = parser.parse_args()
+
+    prompts = [" ".join(WORDS[:3 + (i * 5) % len(WORDS)]) + f" #{i}" for i in range(args.prompts)]
+    generation = {"max_new_tokens": args.max_new_tokens, "do_sample": False}
+    loads = []
+
+    def loader(model_key):
+        loads.append(model_key)
+        return tiny_model(seed=list(MODEL_INFO).index(model_key), hidden_size=128, layers=2)
+
+    runs = {}
+    for batch_size in (1, args.batch_size):
+        loads.clear()
+        model_pool = ModelPool(loader, max_memory=1024 ** 3)
+        runs[batch_size] = run_suite(prompts, list(MODEL_INFO), batch_size, generation, model_pool)
+        assert sorted(loads) == sorted(MODEL_INFO), f"each model should load once, got {loads}"
+
+    for model_key in MODEL_INFO:
+        speeds = [runs[size]["models"][model_key]["tokens_per_second"] for size in runs]
+        print(f"{model_key:<10} tokens/s one at a time {speeds[0]:>8.1f}, batches of {args.batch_size} {speeds[1]:>8.1f}")
+        for n, (one, batched) in enumerate(zip(runs[1]["prompts"], runs[args.batch_size]["prompts"])):
+            assert one["results"][model_key]["response"] == batched["results"][model_key]["response"], (model_key, n)
+    print(f"all {len(prompts)} responses of every model match between the runs")
+
+    def early_stop_loader(model_key):
+        tokenizer, model = loader(model_key)
+        tokenizer.eos_token = tokenizer.convert_ids_to_tokens(stop_token(tokenizer, model, prompts, args.max_new_tokens))
+        return tokenizer, model
+
+    report = run_suite(prompts, list(MODEL_INFO), args.batch_size, generation, ModelPool(early_stop_loader, 1024 ** 3))
+    ordered = 0
+    for model_key in MODEL_INFO:
+        results = [entry["results"][model_key] for entry in report["prompts"]]
+        for a in results:
+            assert abs(a["tokens_per_second"] - a["new_tokens"] / a["latency"]) < 1e-6
+            for b in results:
+                if a["batch"] == b["batch"] and a["new_tokens"] < b["new_tokens"]:
+                    assert a["latency"] < b["latency"], (model_key, a, b)
+                    ordered += 1
+        lengths = sorted({result["new_tokens"] for result in results})
+        print(f"{model_key:<10} with an early end of sequence: new tokens {lengths[0]}-{lengths[-1]}, latency "
+              f"{min(r['latency'] for r in results) * 1000:.1f}-{max(r['latency'] for r in results) * 1000:.1f} ms")
+    assert ordered, "no batch had rows of different lengths to compare"
+    print(f"{ordered} pairs of rows in a batch: the shorter answer always has the lower latency")
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "report")
+        write_markdown(runs[args.batch_size], path + ".md")
+        write_json(runs[args.batch_size], path + ".json")
+        with open(path + ".md", encoding="utf-8") as f:
+            print("\n" + "".join(f.readlines()[:14]))
+
+
+if __name__ == "__main__":
+    main()
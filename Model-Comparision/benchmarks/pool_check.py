@@ -0,0 +1,83 @@
+"""Check the model pool with tiny random models on CPU: reuse, LRU eviction and preloading.
+
+Usage: python benchmarks/pool_check.py [--hidden-size 256] [--layers 4]
+
+Every model in MODEL_INFO is replaced by a tiny LLaMA of the same size. The
+pool's budget holds two of them. The check asks for models in a fixed order.
+After each request it prints whether the model was loaded or reused, the
+models held and the memory in use. It fails if the pool does not evict the
+least recently used model, or if the models held during a load, plus the one
+being loaded, ever exceed the budget. The same is checked with a budget of
+one model, once with sizes taken from earlier loads and once with the
+estimate callable.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tiny_model import tiny_model
+from model_pool import ModelPool, model_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hidden-size", type=int, default=256)
+    parser.add_argument("--layers", type=int, default=4)
+    args = parser.parse_args()
+
+    loads = []
+    pool = None
+
+    def loader(model_key):
+        loads.append(model_key)
+        held = pool.memory_bytes()
+        tokenizer, model = tiny_model(seed=len(loads), hidden_size=args.hidden_size, layers=args.layers)
+        assert held + model_bytes(model) <= pool.max_memory, f"{held} bytes held while loading {model_key}"
+        return tokenizer, model
+
+    size = model_bytes(tiny_model(hidden_size=args.hidden_size, layers=args.layers)[1])
+    pool = ModelPool(loader, max_memory=int(size * 2.5))
+    print(f"each model {size / 1024 ** 2:.1f} MB, budget {pool.max_memory / 1024 ** 2:.1f} MB")
+
+    pool.preload(["instruct", "base"])
+    print(f"preloaded {pool.stats()['models']} (least recently used first)")
+    assert loads == ["base", "instruct"]
+
+    steps = [
+        ("instruct", False, ["base", "instruct"]),
+        ("base", False, ["instruct", "base"]),
+        ("finetuned", True, ["base", "finetuned"]),
+        ("finetuned", False, ["base", "finetuned"]),
+        ("instruct", True, ["finetuned", "instruct"]),
+        ("finetuned", False, ["instruct", "finetuned"]),
+    ]
+    for model_key, expect_load, expect_models in steps:
+        before = len(loads)
+        start = time.perf_counter()
+        pool.get(model_key)
+        elapsed = time.perf_counter() - start
+        loaded = len(loads) > before
+        stats = pool.stats()
+        print(f"get {model_key:<10} {'loaded' if loaded else 'reused':<7} {elapsed * 1000:>8.1f} ms  "
+              f"held {stats['models']}  {stats['memory_bytes'] / 1024 ** 2:.1f} MB")
+        assert loaded == expect_load and stats["models"] == expect_models, (model_key, stats)
+        assert stats["memory_bytes"] <= pool.max_memory
+
+    stats = pool.stats()
+    print(f"hit rate {stats['hit_rate']:.0%}, {stats['evictions']} evictions, "
+          f"load seconds {', '.join(f'{k} {v:.2f}' for k, v in stats['load_seconds'].items())}")
+
+    for estimate in (None, lambda model_key: size):
+        pool = ModelPool(loader, max_memory=int(size * 1.5), estimate=estimate)
+        for model_key in ["base", "instruct", "finetuned", "base"]:
+            pool.get(model_key)
+        assert pool.stats()["models"] == ["base"] and pool.evictions == 3
+        print(f"budget of one model, {'with' if estimate else 'without'} an estimate: "
+              f"{pool.evictions} evictions, never two models held")
+
+
+if __name__ == "__main__":
+    main()
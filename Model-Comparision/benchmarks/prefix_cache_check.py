@@ -0,0 +1,89 @@
+"""Check the prefix cache with tiny random models on CPU: same greedy output, less prefill time.
+
+Usage: python benchmarks/prefix_cache_check.py [--prefix-words 300] [--prompts 4] [--hidden-size 256] [--layers 4]
+
+Every model in MODEL_INFO is replaced by a tiny LLaMA. Each model answers
+the same prompts twice with greedy decoding, all starting with one long
+instruction prefix: once without the cache and once with it. The cache can
+hold the prefix of only two models, so the third one evicts the least
+recently used. The check fails if any response differs. A prompt that is
+only the prefix must bypass the cache. The check prints the time to first
+token with and without the cache, and the cache's hits, evictions and
+prefill time saved.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tiny_model import tiny_model
+from model_pool import ModelPool
+from prefix_cache import PrefixCache
+import main as comparator
+
+WORDS = "answer the question below carefully and concisely using plain language for a general audience".split()
+QUESTIONS = [
+    "What is quantum entanglement?",
+    "Write a haiku about robots.",
+    "Compare classical and quantum computers.",
+    "How do I stay productive at home?",
+]
+
+
+def mean(values):
+    return sum(values) / len(values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prefix-words", type=int, default=300)
+    parser.add_argument("--prompts", type=int, default=4)
+    parser.add_argument("--hidden-size", type=int, default=256)
+    parser.add_argument("--layers", type=int, default=4)
+    args = parser.parse_args()
+
+    def loader(model_key):
+        return tiny_model(seed=list(comparator.MODEL_INFO).index(model_key), hidden_size=args.hidden_size, layers=args.layers)
+
+    comparator.pool = ModelPool(loader, max_memory=1024 ** 3)
+    comparator.GENERATION_CONFIG.clear()
+    comparator.GENERATION_CONFIG.update({"max_new_tokens": 24, "do_sample": False})
+    prefix = "Instructions: " + " ".join(WORDS[i % len(WORDS)] for i in range(args.prefix_words)) + "\n"
+    prompts = [prefix + QUESTIONS[i % len(QUESTIONS)] + f" ({i})" for i in range(args.prompts)]
+
+    tokenizer, model = comparator.pool.get("base")
+    entry_bytes = PrefixCache(1024 ** 3)
+    entry_bytes.register(prefix)
+    entry_bytes.lookup("base", tokenizer, model, prompts[0], tokenizer(prompts[0], return_tensors="pt").input_ids)
+    cache = PrefixCache(max_memory=int(entry_bytes.memory_bytes() * 2.5))
+    cache.register(prefix)
+    print(f"prefix of {len(tokenizer(prefix).input_ids)} tokens, "
+          f"{entry_bytes.memory_bytes() / 1024 ** 2:.1f} MB cached per model, budget for 2")
+
+    print(f"{'model':<10} {'first token without':>20} {'with cache':>11}  responses")
+    for model_key in comparator.MODEL_INFO:
+        runs = {}
+        for name, prefix_cache in (("without", PrefixCache(0)), ("with", cache)):
+            comparator.prefix_cache = prefix_cache
+            runs[name] = [comparator.generate_response(prompt, model_key, stream=False) for prompt in prompts]
+        for n, (plain, cached) in enumerate(zip(runs["without"], runs["with"])):
+            assert plain[:3] == cached[:3], f"{model_key} prompt {n}: output differs with the prefix cache"
+        # The first prompt with the cache pays for the prefill, so compare the others
+        first_tokens = {name: mean([run[3]["time_to_first_token"] for run in runs[name][1:]]) for name in runs}
+        print(f"{model_key:<10} {first_tokens['without'] * 1000:>18.1f}ms {first_tokens['with'] * 1000:>9.1f}ms  "
+              f"all {len(prompts)} identical")
+
+    hits = cache.hits
+    comparator.generate_response(prefix, "base", stream=False)
+    assert cache.hits == hits, "a prompt with nothing after the prefix should not use the cache"
+
+    stats = cache.stats()
+    print(f"prefix cache: {stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, "
+          f"{stats['entries']} entries, {stats['memory_bytes'] / 1024 ** 2:.1f} MB, "
+          f"{stats['saved_seconds']:.2f}s of prefill saved")
+    assert stats["evictions"] >= 1 and stats["memory_bytes"] <= cache.max_memory
+
+
+if __name__ == "__main__":
+    main()
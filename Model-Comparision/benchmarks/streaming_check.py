@@ -0,0 +1,90 @@
+"""Check streamed generation and its latency metrics with tiny random models on CPU.
+
+Usage: python benchmarks/streaming_check.py [--hidden-size 512] [--layers 6]
+
+Each model in MODEL_INFO is replaced by a tiny LLaMA and answers one prompt
+through generate_response. The check captures the text as it is streamed. It
+fails if the text does not arrive in pieces, if it differs from the final
+response, if the token timings do not add up, or if a failing generate hangs
+instead of raising. It prints the latency metrics of each model. With
+--plot and matplotlib installed, it saves the token and latency chart to
+latency.png.
+"""
+import argparse
+import contextlib
+import io
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from tiny_model import tiny_model
+from model_pool import ModelPool
+import main as comparator
+
+PROMPT = "Explain quantum entanglement to a 10-year-old."
+
+
+class Capture(io.StringIO):
+    """Collects stdout and counts the separate writes."""
+
+    writes = 0
+
+    def write(self, text):
+        self.writes += 1
+        return super().write(text)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--hidden-size", type=int, default=512)
+    parser.add_argument("--layers", type=int, default=6)
+    parser.add_argument("--plot", action="store_true", help="Save the chart to latency.png")
+    args = parser.parse_args()
+
+    def loader(model_key):
+        return tiny_model(seed=list(comparator.MODEL_INFO).index(model_key), hidden_size=args.hidden_size, layers=args.layers)
+
+    comparator.pool = ModelPool(loader, max_memory=1024 ** 3)
+    # A random model may sample the end of sequence at once; make every run long enough to time
+    comparator.GENERATION_CONFIG["min_new_tokens"] = 32
+    print(f"{'model':<10} {'tokens':>6} {'first token':>12} {'inter-token':>12} {'p95':>9} {'tokens/s':>9} {'pieces':>7}")
+    for model_key in comparator.MODEL_INFO:
+        captured = Capture()
+        with contextlib.redirect_stdout(captured):
+            response, input_tokens, total_tokens, metrics = comparator.generate_response(PROMPT, model_key)
+        streamed = captured.getvalue()[:-1]
+        print(
+            f"{model_key:<10} {metrics['new_tokens']:>6} {metrics['time_to_first_token'] * 1000:>10.1f}ms "
+            f"{metrics['inter_token_latency'] * 1000:>10.2f}ms {metrics['inter_token_p95'] * 1000:>7.2f}ms "
+            f"{metrics['tokens_per_second']:>9.1f} {captured.writes:>7}"
+        )
+        assert response == (PROMPT + streamed).strip(), "streamed text differs from the response"
+        assert captured.writes > 2, "the response was not streamed"
+        assert metrics["new_tokens"] == total_tokens - input_tokens
+        assert 0 < metrics["time_to_first_token"] < metrics["total_seconds"]
+
+    tokenizer, model = comparator.pool.get("base")
+
+    def broken_generate(**kwargs):
+        raise RuntimeError("generate failed")
+
+    model.generate = broken_generate
+    try:
+        comparator.generate_response(PROMPT, "base", stream=False)
+        raise AssertionError("a failing generate should raise")
+    except RuntimeError as e:
+        print(f"a failing generate raises: {e}")
+
+    if args.plot:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        plt.show = lambda: plt.savefig("latency.png")
+        comparator.plot_token_usage(input_tokens, total_tokens, comparator.MODEL_INFO["base"]["context_length"],
+                                    comparator.latency_by_model)
+        print("chart saved to latency.png")
+
+
+if __name__ == "__main__":
+    main()
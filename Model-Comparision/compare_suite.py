@@ -0,0 +1,173 @@
+"""Run a file of prompts through every model and write a side-by-side report, without any display.
+
+Usage: python compare_suite.py prompts.txt [--models base,instruct,finetuned] [--batch-size 8]
+                               [--max-new-tokens 256] [--greedy] [--output suite_report]
+
+prompts.txt has one prompt per line. Each model is loaded once through the
+model pool and answers the prompts in batches of --batch-size. Prompts of
+similar length are batched together and left-padded, so every row of a
+batch ends where generation starts. Each response records its latency, from
+the start of its batch until its own end of sequence, and its tokens per
+second over that time. The report
+is written as <output>.md, laid out like comparisons.md, and as <output>.json.
+"""
+import argparse
+import json
+import time
+
+import torch
+
+from main import GENERATION_CONFIG, HF_TOKEN, MODEL_INFO, pool, tracing
+from streaming import RowTimer
+
+
+def read_prompts(path):
+    with open(path, encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+def batches(prompts, batch_size):
+    """Indexes of the prompts in batches of similar length, so that little padding is needed."""
+    order = sorted(range(len(prompts)), key=lambda i: len(prompts[i]))
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+def generated_tokens(row, eos_token_id):
+    """New tokens up to and including the first end of sequence; the rest is padding."""
+    tokens = row.tolist()
+    return tokens.index(eos_token_id) + 1 if eos_token_id in tokens else len(tokens)
+
+
+def run_model(model_key, prompts, batch_size, generation, model_pool=pool):
+    """Answer every prompt with one model; returns (per-prompt results, model totals)."""
+    start = time.perf_counter()
+    tokenizer, model = model_pool.get(model_key)
+    load_seconds = time.perf_counter() - start
+    # Decoder-only models continue from the last position, so pad on the left
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+
+    results = [None] * len(prompts)
+    generate_seconds = 0.0
+    total_tokens = 0
+    for batch, indexes in enumerate(batches(prompts, batch_size)):
+        with tracing.span("tokenize", labels={"model": model_key}):
+            inputs = tokenizer([prompts[i] for i in indexes], return_tensors="pt", padding=True).to(model.device)
+        input_length = inputs.input_ids.shape[1]
+
+        start = time.perf_counter()
+        # A row keeps being padded after its end of sequence, so each row is timed to its own end
+        timer = RowTimer(tokenizer.eos_token_id)
+        with torch.inference_mode(), tracing.span("generate", labels={"model": model_key}) as span:
+            outputs = model.generate(
+                **inputs,
+                **generation,
+                pad_token_id=tokenizer.pad_token_id,
+                eos_token_id=tokenizer.eos_token_id,
+                streamer=timer
+            )
+            counts = [generated_tokens(row, tokenizer.eos_token_id) for row in outputs[:, input_length:]]
+            span.set(input_tokens=int(inputs.attention_mask.sum()), output_tokens=sum(counts))
+        elapsed = time.perf_counter() - start
+        generate_seconds += elapsed
+        total_tokens += sum(counts)
+
+        responses = tokenizer.batch_decode(outputs[:, input_length:], skip_special_tokens=True)
+        latencies = timer.seconds(len(indexes))
+        for row, i in enumerate(indexes):
+            results[i] = {
+                "response": responses[row].strip(),
+                "input_tokens": int(inputs.attention_mask[row].sum()),
+                "new_tokens": counts[row],
+                "latency": latencies[row],
+                "tokens_per_second": counts[row] / latencies[row] if latencies[row] else 0.0,
+                "batch": batch,
+                "batch_size": len(indexes),
+            }
+
+    totals = {
+        "id": MODEL_INFO[model_key]["id"],
+        "load_seconds": load_seconds,
+        "generate_seconds": generate_seconds,
+        "new_tokens": total_tokens,
+        "tokens_per_second": total_tokens / generate_seconds if generate_seconds else 0.0,
+    }
+    return results, totals
+
+
+def run_suite(prompts, model_keys, batch_size=8, generation=GENERATION_CONFIG, model_pool=pool):
+    """Run every prompt on every model, one model at a time; returns the report as a dict."""
+    report = {"models": {}, "prompts": [{"prompt": prompt, "results": {}} for prompt in prompts]}
+    for model_key in model_keys:
+        print(f"Running {len(prompts)} prompts on {model_key} ...")
+        results, totals = run_model(model_key, prompts, batch_size, generation, model_pool)
+        report["models"][model_key] = totals
+        for entry, result in zip(report["prompts"], results):
+            entry["results"][model_key] = result
+    report["pool"] = model_pool.stats()
+    return report
+
+
+def cell(text):
+    return text.replace("|", "\\|").replace("\n", "<br>")
+
+
+def write_markdown(report, path):
+    lines = ["# Model Comparisons", "", "## ⏱️ Speed", ""]
+    lines.append("| Model | Load (s) | Generate (s) | New Tokens | Tokens/s |")
+    lines.append("|-------|----------|--------------|------------|----------|")
+    for model_key, totals in report["models"].items():
+        lines.append(
+            f"| **{model_key}** | {totals['load_seconds']:.1f} | {totals['generate_seconds']:.1f} "
+            f"| {totals['new_tokens']} | {totals['tokens_per_second']:.1f} |"
+        )
+    for n, entry in enumerate(report["prompts"], 1):
+        lines += ["", "---", "", f"## 🔹 Prompt {n}: `{entry['prompt']}`", ""]
+        lines.append("| Model | Summary | Response | Latency (s) | Tokens/s |")
+        lines.append("|-------|---------|----------|-------------|----------|")
+        for model_key, result in entry["results"].items():
+            lines.append(
+                f"| **{model_key}** | {cell(MODEL_INFO[model_key]['summary'])} | {cell(result['response'])} "
+                f"| {result['latency']:.2f} | {result['tokens_per_second']:.1f} |"
+            )
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def write_json(report, path):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("prompts", help="File with one prompt per line")
+    parser.add_argument("--models", default=",".join(MODEL_INFO), help="Comma-separated keys of MODEL_INFO")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-new-tokens", type=int, default=GENERATION_CONFIG["max_new_tokens"])
+    parser.add_argument("--greedy", action="store_true", help="Decode greedily instead of sampling, for repeatable output")
+    parser.add_argument("--output", default="suite_report", help="Report path without extension")
+    args = parser.parse_args()
+
+    if not HF_TOKEN:
+        print("⚠️ Warning: No Hugging Face token found in environment variables.")
+        print("Please create a .env file with your HUGGINGFACE_TOKEN.")
+        return
+    model_keys = [key for key in args.models.split(",") if key]
+    unknown = [key for key in model_keys if key not in MODEL_INFO]
+    if unknown:
+        parser.error(f"unknown models {', '.join(unknown)}; choose from {', '.join(MODEL_INFO)}")
+
+    generation = {**GENERATION_CONFIG, "max_new_tokens": args.max_new_tokens}
+    if args.greedy:
+        generation = {"max_new_tokens": args.max_new_tokens, "do_sample": False,
+                      "repetition_penalty": GENERATION_CONFIG["repetition_penalty"]}
+    report = run_suite(read_prompts(args.prompts), model_keys, args.batch_size, generation)
+    write_markdown(report, args.output + ".md")
+    write_json(report, args.output + ".json")
+    print(f"Report written to {args.output}.md and {args.output}.json")
+
+
+if __name__ == "__main__":
+    main()
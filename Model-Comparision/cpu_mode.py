@@ -0,0 +1,59 @@
+"""Settings that make the comparator usable on hosts without a GPU.
+
+Three CPU modes are supported:
+
+- fp32: the weights as loaded.
+- bf16: loads the weights in bfloat16, which halves memory. It is used only
+  where the CPU has native bfloat16 instructions; elsewhere it would be
+  slower than fp32, so fp32 is used instead.
+- int8: applies dynamic int8 quantization to every Linear layer. Their
+  weights are stored in int8, and activations are quantized on the fly at
+  each matmul. Embeddings and norms stay in fp32.
+"""
+import os
+
+import torch
+
+CPU_MODES = ("fp32", "bf16", "int8")
+
+
+def bf16_supported():
+    """Whether this CPU has native bfloat16 matmuls (AVX512-BF16 or AMX)."""
+    checks = ("_is_avx512_bf16_supported", "_is_amx_tile_supported")
+    return any(getattr(torch.cpu, name, lambda: False)() for name in checks)
+
+
+def resolve_mode(mode):
+    if mode not in CPU_MODES:
+        raise ValueError(f"Unknown CPU mode {mode!r}; choose from {', '.join(CPU_MODES)}")
+    if mode == "bf16" and not bf16_supported():
+        print("bfloat16 is not supported natively on this CPU; using fp32")
+        return "fp32"
+    return mode
+
+
+def load_dtype(mode):
+    """The dtype to load weights in for a resolved mode; int8 quantizes after loading in fp32."""
+    return torch.bfloat16 if mode == "bf16" else torch.float32
+
+
+def optimize_for_cpu(model, mode):
+    """Put a loaded model in eval mode and quantize it if mode is int8; returns the model."""
+    model.eval()
+    if mode == "int8":
+        # In place, so the fp32 Linear weights are freed instead of copied
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    return model
+
+
+def configure_threads(threads=0):
+    """Use the given number of intra-op threads; 0 keeps torch's default of one per physical core.
+
+    Hyperthreads share the matmul units of their core, so more threads than
+    physical cores usually slows generation down.
+    """
+    if threads > 0:
+        torch.set_num_threads(threads)
+    # Tokenizers run in the same process; their own thread pool would compete with torch's
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    return torch.get_num_threads()
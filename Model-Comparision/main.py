@@ -2,11 +2,20 @@
 
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM
-from IPython.display import display, Markdown
-import matplotlib.pyplot as plt
+from huggingface_hub import HfApi
 import os
+import sys
+import time
+from threading import Thread
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared import tracing
+from model_pool import ModelPool
+import cpu_mode
+from streaming import TimedStreamer, latency_metrics
+from prefix_cache import PrefixCache
+
 # Load environment variables
 load_dotenv()
 
@@ -14,7 +23,19 @@ load_dotenv()
 HF_TOKEN = os.getenv("HUGGINGFACE_TOKEN")
 DEVICE = os.getenv("DEVICE", "cuda" if torch.cuda.is_available() else "cpu")
 MAX_MEMORY = int(os.getenv("MAX_MEMORY", 16)) * (1024 * 1024 * 1024)  # Convert GB to bytes
+# On CPU: fp32, bf16 or int8 (see cpu_mode.py), and intra-op threads (0 = one per physical core)
+CPU_MODE = os.getenv("CPU_MODE", "fp32")
+CPU_THREADS = int(os.getenv("CPU_THREADS", 0))
+# Budget in GB for cached prompt prefixes, and a file holding a prefix to register at startup
+PREFIX_CACHE_MEMORY = int(os.getenv("PREFIX_CACHE_MEMORY", 2)) * (1024 * 1024 * 1024)
+PREFIX_FILE = os.getenv("PREFIX_FILE")
+# Models to load at startup, most important first
+PRELOAD_MODELS = [key for key in os.getenv("PRELOAD_MODELS", "").split(",") if key]
+
+if DEVICE == "cpu":
+    cpu_mode.configure_threads(CPU_THREADS)
 
+# An entry may set "cpu_mode" to use instead of CPU_MODE for that model
 MODEL_INFO = {
     "base": {
         "id": "meta-llama/Llama-2-7b-hf",
@@ -33,80 +54,199 @@ MODEL_INFO = {
     }
 }
 
+# Sampling settings shared by the interactive tool and compare_suite.py
+GENERATION_CONFIG = {
+    "max_new_tokens": 256,
+    "do_sample": True,
+    "top_k": 50,
+    "top_p": 0.95,
+    "temperature": 0.7,
+    "repetition_penalty": 1.1,
+}
+
+def model_mode(model_key):
+    """The resolved CPU mode for a model, or None on GPU."""
+    return cpu_mode.resolve_mode(MODEL_INFO[model_key].get("cpu_mode", CPU_MODE)) if DEVICE == "cpu" else None
+
+def model_dtype(mode):
+    return torch.float16 if DEVICE == "cuda" else cpu_mode.load_dtype(mode)
+
+def estimate_model_bytes(model_key):
+    """Bytes the model's weights take once loaded, from its parameter count on the Hub; None if unknown."""
+    try:
+        info = HfApi().model_info(MODEL_INFO[model_key]['id'], token=HF_TOKEN)
+    except Exception as e:
+        print(f"Could not look up the size of {model_key}: {e}")
+        return None
+    parameters = getattr(getattr(info, "safetensors", None), "total", None)
+    if not parameters:
+        return None
+    return parameters * torch.finfo(model_dtype(model_mode(model_key))).bits // 8
+
 def load_model_and_tokenizer(model_key):
     model_id = MODEL_INFO[model_key]['id']
     print(f"Loading {model_id} ...")
     
-    # Use Hugging Face token for authentication
-    tokenizer = AutoTokenizer.from_pretrained(model_id, token=HF_TOKEN)
+    mode = model_mode(model_key)
     
-    # Configure device and memory settings
-    model = AutoModelForCausalLM.from_pretrained(
-        model_id,
-        token=HF_TOKEN,
-        torch_dtype=torch.float16 if DEVICE == "cuda" else torch.float32,
-        device_map="auto",
-        max_memory={0: f"{MAX_MEMORY}"} if DEVICE == "cuda" else None
-    )
+    with tracing.span("model.load", labels={"model": model_key}):
+        # Use Hugging Face token for authentication
+        tokenizer = AutoTokenizer.from_pretrained(model_id, token=HF_TOKEN)
+        
+        # Configure device and memory settings
+        model = AutoModelForCausalLM.from_pretrained(
+            model_id,
+            token=HF_TOKEN,
+            torch_dtype=model_dtype(mode),
+            device_map="auto",
+            max_memory={0: f"{MAX_MEMORY}"} if DEVICE == "cuda" else None
+        )
+        if mode:
+            print(f"Using {mode} on CPU with {torch.get_num_threads()} threads")
+            model = cpu_mode.optimize_for_cpu(model, mode)
     return tokenizer, model
 
-def generate_response(prompt, model_key):
-    tokenizer, model = load_model_and_tokenizer(model_key)
+# Loaded models stay in memory between prompts, up to MAX_MEMORY
+pool = ModelPool(load_model_and_tokenizer, MAX_MEMORY, estimate=estimate_model_bytes)
+
+# Prompts starting with a registered prefix reuse its past key/values
+prefix_cache = PrefixCache(PREFIX_CACHE_MEMORY)
+if PREFIX_FILE:
+    with open(PREFIX_FILE, encoding="utf-8") as f:
+        prefix_cache.register(f.read())
+
+# Latency of the latest run of each model, shown side by side by compare_model
+latency_by_model = {}
+
+def generate_response(prompt, model_key, stream=True):
+    """Generate a response, printing it as it is produced when stream is set.
+    
+    Returns (text, input tokens, total tokens, latency metrics).
+    """
+    tokenizer, model = pool.get(model_key)
     
-    inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
+    with tracing.span("tokenize", labels={"model": model_key}):
+        inputs = tokenizer(prompt, return_tensors="pt").to(model.device)
     input_length = inputs.input_ids.shape[1]
 
-    with torch.no_grad():
-        outputs = model.generate(
-            **inputs,
-            max_new_tokens=256,
-            do_sample=True,
-            top_k=50,
-            top_p=0.95,
-            temperature=0.7,
-            repetition_penalty=1.1,
-            eos_token_id=tokenizer.eos_token_id
-        )
+    # Started before the prefix lookup, so a prefix prefilled now counts towards the first token
+    streamer = TimedStreamer(tokenizer)
+    cache = {}
+    past = prefix_cache.lookup(model_key, tokenizer, model, prompt, inputs.input_ids)
+    if past is not None:
+        cache["past_key_values"] = past
+    result = {}
+    
+    def run():
+        # inference_mode is per thread, so it is entered here rather than around the thread
+        try:
+            with torch.inference_mode():
+                result["outputs"] = model.generate(
+                    **inputs,
+                    **GENERATION_CONFIG,
+                    **cache,
+                    eos_token_id=tokenizer.eos_token_id,
+                    streamer=streamer
+                )
+        except Exception as e:
+            result["error"] = e
+            streamer.end()
+
+    with tracing.span("generate", labels={"model": model_key}) as span:
+        thread = Thread(target=run)
+        thread.start()
+        for text in streamer:
+            if stream:
+                print(text, end="", flush=True)
+        thread.join()
+        end = time.perf_counter()
+        if stream:
+            print()
+        if "error" in result:
+            raise result["error"]
+        outputs = result["outputs"]
+        span.set(input_tokens=input_length, output_tokens=outputs.shape[1] - input_length)
+
+    metrics = latency_metrics(streamer.start, streamer.token_times, end)
+    if metrics["time_to_first_token"] is not None:
+        tracing.observe("generate.first_token", metrics["time_to_first_token"], labels={"model": model_key})
+    latency_by_model[model_key] = metrics
 
     output_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
     total_tokens = outputs.shape[1]
     
-    return output_text.strip(), input_length, total_tokens
+    return output_text.strip(), input_length, total_tokens, metrics
 
-def plot_token_usage(input_tokens, output_tokens, context_limit):
+def plot_token_usage(input_tokens, output_tokens, context_limit, latency=None):
+    """Token breakdown, with time to first token and tokens per second of each model run so far next to it."""
+    # Imported here so that headless runs (compare_suite.py) need no display libraries
+    import matplotlib.pyplot as plt
+    
     labels = ['Input Tokens', 'Output Tokens', 'Remaining Capacity']
     values = [input_tokens, output_tokens - input_tokens, max(0, context_limit - output_tokens)]
     colors = ['#FF9999','#99CCFF','#C1E1C1']
 
-    plt.figure(figsize=(7, 4))
-    plt.bar(labels, values, color=colors)
-    plt.title("📊 Token Usage Breakdown")
-    plt.ylabel("Tokens")
+    latency = {key: m for key, m in (latency or {}).items() if m["time_to_first_token"] is not None}
+    columns = 3 if latency else 1
+    fig, axes = plt.subplots(1, columns, figsize=(14, 4) if latency else (7, 4), squeeze=False)
+    ax = axes[0][0]
+    ax.bar(labels, values, color=colors)
+    ax.set_title("📊 Token Usage Breakdown")
+    ax.set_ylabel("Tokens")
     for i, v in enumerate(values):
-        plt.text(i, v + 20, str(v), ha='center', fontweight='bold')
-    plt.ylim(0, context_limit + 300)
+        ax.text(i, v + 20, str(v), ha='center', fontweight='bold')
+    ax.set_ylim(0, context_limit + 300)
+    
+    if latency:
+        models = list(latency)
+        panels = [
+            (axes[0][1], "Time to First Token", "ms", [latency[m]["time_to_first_token"] * 1000 for m in models], "{:.0f}"),
+            (axes[0][2], "Throughput", "tokens/s", [latency[m]["tokens_per_second"] for m in models], "{:.1f}"),
+        ]
+        for ax, title, unit, values, fmt in panels:
+            ax.bar(models, values, color='#FFCC99')
+            ax.set_title(title)
+            ax.set_ylabel(unit)
+            for i, v in enumerate(values):
+                ax.text(i, v, fmt.format(v), ha='center', va='bottom', fontweight='bold')
+    fig.tight_layout()
     plt.show()
 
 def compare_model(prompt, model_key):
+    from IPython.display import display, Markdown
+    
     print(f"\n=== {model_key.upper()} MODEL ===")
     model_data = MODEL_INFO[model_key]
 
     # Show summary
     display(Markdown(f"### 🔍 Model Summary\n{model_data['summary']}"))
 
-    # Generate
-    response, input_tokens, total_tokens = generate_response(prompt, model_key)
-    
-    # Show response
-    display(Markdown(f"### 🧠 Response\n```\n{response}\n```"))
+    # Generate, showing the response as it is produced
+    display(Markdown("### 🧠 Response"))
+    response, input_tokens, total_tokens, latency = generate_response(prompt, model_key)
 
     # Show token stats
     print(f"Input Tokens: {input_tokens}")
     print(f"Total Tokens Used: {total_tokens}")
     print(f"Model Max Context: {model_data['context_length']}")
     
+    # Show latency, which is what models are chosen by
+    if latency["time_to_first_token"] is not None:
+        print(f"Time to First Token: {latency['time_to_first_token'] * 1000:.0f} ms")
+    if latency["inter_token_latency"] is not None:
+        print(f"Inter-token Latency: {latency['inter_token_latency'] * 1000:.1f} ms (p95 {latency['inter_token_p95'] * 1000:.1f} ms)")
+    print(f"Throughput: {latency['tokens_per_second']:.1f} tokens/s")
+    
+    stats = pool.stats()
+    print(f"Model pool: {len(stats['models'])} loaded, {stats['memory_bytes'] / 1024 ** 3:.1f} GB, "
+          f"hit rate {stats['hit_rate']:.0%}, load time {stats['load_seconds'].get(model_key, 0):.1f}s")
+    if prefix_cache.prefixes:
+        stats = prefix_cache.stats()
+        print(f"Prefix cache: {stats['hits']} hits, {stats['memory_bytes'] / 1024 ** 2:.0f} MB, "
+              f"{stats['saved_seconds']:.1f}s of prefill saved")
+    
     # Plot
-    plot_token_usage(input_tokens, total_tokens, model_data['context_length'])
+    plot_token_usage(input_tokens, total_tokens, model_data['context_length'], latency_by_model)
 
 def main():
     print("🧠 LLaMA Model Comparator Tool")
@@ -118,6 +258,10 @@ def main():
         print("See .env.example for reference.")
         return
     
+    if PRELOAD_MODELS:
+        pool.preload(PRELOAD_MODELS)
+        print(f"Preloaded: {', '.join(PRELOAD_MODELS)}")
+    
     # === 🔧 Interactive Input ===
     prompt = input("Enter your prompt: ")
     model_type = input("Choose model type [base/instruct/finetuned]: ").strip().lower()
@@ -0,0 +1,119 @@
+"""Keeps loaded models and tokenizers in memory between generations.
+
+ModelPool wraps a loader such as main.load_model_and_tokenizer. The first
+request for a model loads it. Later requests reuse the loaded copy. Before a
+model is loaded, the least recently used ones are dropped until it fits in
+max_memory bytes, so two models never have to fit at once when the budget
+holds one. The size of a model comes from an earlier load, else from the
+estimate callable, else it is taken to be the largest model loaded so far.
+"""
+import gc
+import time
+from collections import OrderedDict
+
+import torch
+
+from shared import tracing
+
+
+def model_bytes(model):
+    """Bytes held by the model's parameters and buffers, including dynamically quantized weights."""
+    tensors = list(model.parameters()) + list(model.buffers())
+    for module in model.modules():
+        # Quantized Linear layers keep their int8 weights in packed params, not parameters
+        if isinstance(module, torch.ao.nn.quantized.dynamic.Linear):
+            tensors += [t for t in module._weight_bias() if t is not None]
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class ModelPool:
+    """An LRU pool of (tokenizer, model) pairs loaded by loader(model_key), bounded by max_memory bytes."""
+
+    def __init__(self, loader, max_memory, estimate=None):
+        self.loader = loader
+        self.max_memory = max_memory
+        # estimate(model_key) returns a model's size in bytes before it is loaded, or None
+        self.estimate = estimate
+        self.models = OrderedDict()
+        # Sizes survive eviction, so a reload can make room up front
+        self.sizes = {}
+        self.load_seconds = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, model_key):
+        """Return (tokenizer, model) for model_key, loading it if it is not in the pool."""
+        if model_key in self.models:
+            self.hits += 1
+            self.models.move_to_end(model_key)
+            tracing.count("model_pool", result="hit")
+            return self.models[model_key]
+
+        self.misses += 1
+        tracing.count("model_pool", result="miss")
+        self._make_room(self._expected_size(model_key))
+        start = time.perf_counter()
+        tokenizer, model = self.loader(model_key)
+        self.load_seconds[model_key] = time.perf_counter() - start
+        self.sizes[model_key] = model_bytes(model)
+        self.models[model_key] = (tokenizer, model)
+        # A model bigger than the budget is still kept on its own
+        self._make_room(0, keep=model_key)
+        self._report()
+        return tokenizer, model
+
+    def _expected_size(self, model_key):
+        size = self.sizes.get(model_key)
+        if size is None and self.estimate is not None:
+            size = self.estimate(model_key)
+        if size is None:
+            size = max(self.sizes.values(), default=0)
+        return size
+
+    def preload(self, model_keys):
+        """Load the given models ahead of the first request, most important first."""
+        for model_key in reversed(list(model_keys)):
+            self.get(model_key)
+
+    def memory_bytes(self):
+        return sum(self.sizes[key] for key in self.models)
+
+    def evict(self, model_key):
+        if self.models.pop(model_key, None) is None:
+            return
+        self.evictions += 1
+        tracing.count("model_pool_evictions")
+        # Free the weights now rather than whenever the collector gets to them
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        self._report()
+
+    def clear(self):
+        for model_key in list(self.models):
+            self.evict(model_key)
+
+    def _make_room(self, needed, keep=None):
+        for model_key in list(self.models):
+            if self.memory_bytes() + needed <= self.max_memory:
+                break
+            if model_key != keep:
+                self.evict(model_key)
+
+    def _report(self):
+        tracing.gauge("model_pool_memory_bytes", self.memory_bytes())
+        tracing.gauge("model_pool_models", len(self.models))
+
+    def stats(self):
+        requests = self.hits + self.misses
+        return {
+            "models": list(self.models),
+            "memory_bytes": self.memory_bytes(),
+            "max_memory": self.max_memory,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests if requests else 0.0,
+            "evictions": self.evictions,
+            "load_seconds": dict(self.load_seconds),
+        }
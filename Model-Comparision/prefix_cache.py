@@ -0,0 +1,134 @@
+"""Reuses the attention cache of a shared prompt prefix across prompts.
+
+When a prompt starts with a registered prefix, such as a long instruction
+block, the prefix's past key/values are computed once per model. Later
+prompts with that prefix only prefill the rest of the prompt. Entries are
+evicted in least recently used order when the cached tensors would exceed
+max_memory bytes. The prefill time of every reused prefix is counted as saved.
+
+generate extends the cache it is given in place, so each call gets a deep
+copy. A prefix is used only if the prompt's token ids start with the prefix's
+own token ids. A prefix whose last token merges with the text after it is
+skipped, so the output is the same as without the cache.
+
+Before transformers 4.36, generate kept only the last prompt token whenever
+a cache was passed, dropping the tokens between the prefix and it. With an
+older version no prefix is registered and every prompt runs without the cache.
+"""
+import copy
+import time
+from collections import OrderedDict
+
+import torch
+import transformers
+from packaging import version
+
+from shared import tracing
+
+# First version whose generate slices the prompt by the cache's length
+MIN_TRANSFORMERS = "4.36.0"
+SUPPORTED = version.parse(transformers.__version__) >= version.parse(MIN_TRANSFORMERS)
+
+
+def cache_bytes(past):
+    """Bytes held by a cache's key and value tensors."""
+    layers = getattr(past, "layers", None)
+    pairs = [(layer.keys, layer.values) for layer in layers] if layers is not None else past
+    return sum(t.numel() * t.element_size() for pair in pairs for t in pair if t is not None)
+
+
+class PrefixCache:
+    """Past key/values of registered prefixes, per model, in an LRU bounded by max_memory bytes."""
+
+    def __init__(self, max_memory):
+        self.max_memory = max_memory
+        self.prefixes = []
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.saved_seconds = 0.0
+
+    def register(self, prefix):
+        if not SUPPORTED:
+            print(f"Prefix cache disabled: it needs transformers>={MIN_TRANSFORMERS}, "
+                  f"found {transformers.__version__}")
+            return
+        if prefix and prefix not in self.prefixes:
+            self.prefixes.append(prefix)
+            # Longest first, so the most specific prefix wins
+            self.prefixes.sort(key=len, reverse=True)
+
+    def lookup(self, model_key, tokenizer, model, prompt, input_ids):
+        """Return a copy of the cache for the longest registered prefix of prompt, or None.
+
+        input_ids are the prompt's token ids, shape (1, length).
+        """
+        for prefix in self.prefixes:
+            if not prompt.startswith(prefix):
+                continue
+            key = (model_key, prefix)
+            entry = self.entries.get(key)
+            cached = entry is not None
+            if not cached:
+                entry = self._prefill(key, tokenizer, model)
+                if entry is None:
+                    continue
+            prefix_ids = entry["input_ids"].to(input_ids.device)
+            length = prefix_ids.shape[1]
+            # At least one token must be left for generate to run on
+            if input_ids.shape[1] <= length or not torch.equal(input_ids[0, :length], prefix_ids[0]):
+                continue
+            if cached:
+                self.hits += 1
+                self.saved_seconds += entry["prefill_seconds"]
+                self.entries.move_to_end(key)
+                tracing.count("prefix_cache", result="hit")
+            return copy.deepcopy(entry["past"])
+        return None
+
+    def _prefill(self, key, tokenizer, model):
+        self.misses += 1
+        tracing.count("prefix_cache", result="miss")
+        model_key, prefix = key
+        input_ids = tokenizer(prefix, return_tensors="pt").input_ids.to(model.device)
+        start = time.perf_counter()
+        with torch.inference_mode(), tracing.span("prefix.prefill", labels={"model": model_key}) as span:
+            past = model(input_ids=input_ids, use_cache=True).past_key_values
+            span.set(input_tokens=input_ids.shape[1])
+        entry = {
+            "input_ids": input_ids,
+            "past": past,
+            "bytes": cache_bytes(past),
+            "prefill_seconds": time.perf_counter() - start,
+        }
+        if entry["bytes"] > self.max_memory:
+            return None
+        self.entries[key] = entry
+        self._evict()
+        return entry
+
+    def memory_bytes(self):
+        return sum(entry["bytes"] for entry in self.entries.values())
+
+    def _evict(self):
+        while self.memory_bytes() > self.max_memory:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        tracing.gauge("prefix_cache_bytes", self.memory_bytes())
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "prefixes": len(self.prefixes),
+            "entries": len(self.entries),
+            "memory_bytes": self.memory_bytes(),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "saved_seconds": self.saved_seconds,
+        }
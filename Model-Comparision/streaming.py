@@ -0,0 +1,78 @@
+"""Streams generated text as it is produced and times each token.
+
+TimedStreamer is a TextIteratorStreamer that also records when each new token
+arrives. latency_metrics turns those times into:
+
+- time to first token
+- inter-token latency
+- tokens per second
+
+RowTimer times a batched generate instead: it records when each row of the
+batch produces its end of sequence.
+"""
+import time
+
+from transformers import TextIteratorStreamer
+from transformers.generation.streamers import BaseStreamer
+
+
+class TimedStreamer(TextIteratorStreamer):
+    """Yields decoded text while generate runs in another thread; token_times holds each new token's arrival."""
+
+    def __init__(self, tokenizer, **kwargs):
+        super().__init__(tokenizer, skip_prompt=True, skip_special_tokens=True, **kwargs)
+        self.start = time.perf_counter()
+        self.token_times = []
+
+    def put(self, value):
+        # generate passes the prompt first, then one token per step
+        if not self.next_tokens_are_prompt:
+            self.token_times.extend([time.perf_counter()] * value.numel())
+        super().put(value)
+
+
+class RowTimer(BaseStreamer):
+    """Records when each row of a batch finishes; rows without an end of sequence finish at the last step."""
+
+    def __init__(self, eos_token_id):
+        self.eos_token_id = eos_token_id
+        self.start = time.perf_counter()
+        self.finished = {}
+        self.last = self.start
+        self.prompt_seen = False
+
+    def put(self, value):
+        # generate passes the prompt first, then one token per row at each step
+        if not self.prompt_seen:
+            self.prompt_seen = True
+            return
+        self.last = time.perf_counter()
+        for row, token in enumerate(value.view(-1).tolist()):
+            if token == self.eos_token_id and row not in self.finished:
+                self.finished[row] = self.last
+
+    def end(self):
+        pass
+
+    def seconds(self, rows):
+        """Seconds from the start until each of the first `rows` rows finished."""
+        return [self.finished.get(row, self.last) - self.start for row in range(rows)]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round((len(values) - 1) * p / 100)))]
+
+
+def latency_metrics(start, token_times, end=None):
+    """Latency of one generation from its start time and the arrival time of each token."""
+    end = end or (token_times[-1] if token_times else time.perf_counter())
+    gaps = [b - a for a, b in zip(token_times, token_times[1:])]
+    return {
+        "new_tokens": len(token_times),
+        "time_to_first_token": token_times[0] - start if token_times else None,
+        "inter_token_latency": sum(gaps) / len(gaps) if gaps else None,
+        "inter_token_p95": percentile(gaps, 95) if gaps else None,
+        "tokens_per_second": len(token_times) / (end - start) if end > start else 0.0,
+        "total_seconds": end - start,
+    }
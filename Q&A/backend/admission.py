@@ -0,0 +1,195 @@
+"""Admission control for the /analyze endpoints.
+
+Every analyze request is charged an estimated memory cost: its upload size
+plus ADMISSION_REQUEST_COST for decoding and preprocessing. A request runs
+only while fewer than ADMISSION_MAX_CONCURRENT are running and the running
+costs fit in ADMISSION_MEMORY_BYTES. Otherwise it waits in a FIFO queue of at
+most ADMISSION_MAX_QUEUE requests. When the queue is full, or a request has
+waited ADMISSION_QUEUE_TIMEOUT seconds, it is shed with 429 and a Retry-After
+estimated from recent request times. Request bodies larger than
+UPLOAD_MAX_BYTES are refused with 413, either from their Content-Length or
+once that many bytes have arrived.
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from shared import tracing
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot be admitted; retry_after is in seconds."""
+
+    def __init__(self, retry_after):
+        super().__init__("Server is busy, please retry later")
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Bounds how many requests run at once and the memory they are expected to use."""
+
+    def __init__(self, max_concurrent=16, memory_budget=1024 ** 3, max_queue=64, queue_timeout=30.0):
+        self.max_concurrent = max_concurrent
+        self.memory_budget = memory_budget
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.memory = 0
+        self.shed = 0
+        # Moving average of how long admitted requests run, for Retry-After
+        self.service_time = 1.0
+        self._waiters = deque()
+
+    def _fits(self, cost):
+        # A request bigger than the whole budget may still run on its own
+        return self.active < self.max_concurrent and (self.memory + cost <= self.memory_budget or self.active == 0)
+
+    def _take(self, cost):
+        self.active += 1
+        self.memory += cost
+        self._report()
+
+    def _report(self):
+        tracing.gauge("admission_in_flight", self.active)
+        tracing.gauge("admission_memory_bytes", self.memory)
+        tracing.gauge("admission_queue_depth", len(self._waiters))
+
+    def retry_after(self):
+        """Seconds until the queue is likely to have drained enough to admit one more request."""
+        return max(1, math.ceil(self.service_time * (len(self._waiters) + 1) / self.max_concurrent))
+
+    def _shed(self, reason):
+        self.shed += 1
+        tracing.count("admission_shed", reason=reason)
+        return Overloaded(self.retry_after())
+
+    async def acquire(self, cost):
+        """Wait until the request may run; raises Overloaded when it is shed."""
+        if not self._waiters and self._fits(cost):
+            self._take(cost)
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._shed("queue_full")
+
+        waiter = (cost, asyncio.get_running_loop().create_future())
+        self._waiters.append(waiter)
+        self._report()
+        try:
+            await asyncio.wait_for(waiter[1], self.queue_timeout)
+        except asyncio.TimeoutError:
+            # A slot granted as the wait timed out is given back before shedding
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release(cost)
+            else:
+                self._forget(waiter)
+            raise self._shed("queue_timeout")
+        except asyncio.CancelledError:
+            # The client went away; give back a slot that was granted at the same moment
+            if waiter[1].done() and not waiter[1].cancelled():
+                self.release(cost)
+            else:
+                self._forget(waiter)
+            raise
+
+    def release(self, cost, duration=None):
+        self.active -= 1
+        self.memory -= cost
+        if duration is not None:
+            self.service_time = 0.8 * self.service_time + 0.2 * duration
+        # Admit waiters in order while the head of the queue fits
+        while self._waiters and self._fits(self._waiters[0][0]):
+            waiter_cost, future = self._waiters.popleft()
+            if not future.done():
+                self._take(waiter_cost)
+                future.set_result(None)
+        self._report()
+
+    def _forget(self, waiter):
+        if waiter in self._waiters:
+            self._waiters.remove(waiter)
+        self._report()
+
+    def stats(self):
+        return {
+            "in_flight": self.active,
+            "memory_bytes": self.memory,
+            "queue_depth": len(self._waiters),
+            "shed": self.shed,
+        }
+
+
+def upload_max_bytes():
+    return int(os.getenv("UPLOAD_MAX_BYTES", 20 * 1024 * 1024))
+
+
+def admission_from_env():
+    return AdmissionController(
+        max_concurrent=int(os.getenv("ADMISSION_MAX_CONCURRENT", 16)),
+        memory_budget=int(os.getenv("ADMISSION_MEMORY_BYTES", 1024 ** 3)),
+        max_queue=int(os.getenv("ADMISSION_MAX_QUEUE", 64)),
+        queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT", 30)),
+    )
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying the body cap and an AdmissionController to POSTs under the given paths.
+
+    The admission slot is held until the response has been sent, so a
+    streamed answer counts as running until its last event.
+    """
+
+    def __init__(self, app, controller, paths=("/analyze",), max_body_bytes=None, request_cost=None):
+        self.app = app
+        self.controller = controller
+        self.paths = tuple(paths)
+        # Read when the app is built rather than on import, so a .env loaded after the import applies
+        self.max_body_bytes = upload_max_bytes() if max_body_bytes is None else max_body_bytes
+        self.request_cost = (int(os.getenv("ADMISSION_REQUEST_COST", 32 * 1024 * 1024))
+                             if request_cost is None else request_cost)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST" or not scope["path"].startswith(self.paths):
+            await self.app(scope, receive, send)
+            return
+
+        length = dict(scope["headers"]).get(b"content-length", b"")
+        length = int(length) if length.isdigit() else None
+        if length is not None and length > self.max_body_bytes:
+            await self._too_large()(scope, receive, send)
+            return
+
+        cost = self.request_cost + (length or 0)
+        try:
+            await self.controller.acquire(cost)
+        except Overloaded as e:
+            response = JSONResponse({"detail": str(e)}, status_code=429, headers={"Retry-After": str(e.retry_after)})
+            await response(scope, receive, send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_body_bytes:
+                    raise HTTPException(status_code=413, detail=self._too_large_detail())
+            return message
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, limited_receive, send)
+        finally:
+            self.controller.release(cost, time.perf_counter() - start)
+
+    def _too_large_detail(self):
+        return f"Upload is larger than {self.max_body_bytes} bytes"
+
+    def _too_large(self):
+        return JSONResponse({"detail": self._too_large_detail()}, status_code=413)
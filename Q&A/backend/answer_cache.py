@@ -0,0 +1,55 @@
+"""Caching of /analyze answers.
+
+An answer is keyed by a hash of the preprocessed image bytes, the normalized
+question and the model name. Answers live in the shared two-tier ResponseCache:
+an in-memory LRU, plus a SQLite file when ANSWER_CACHE_PATH is set. Concurrent
+requests for the same key are merged by SingleFlight into one Gemini call.
+"""
+import asyncio
+import hashlib
+import os
+
+from shared.llm_cache import ResponseCache
+
+
+def normalize_question(question):
+    """Case and whitespace do not change the question."""
+    return " ".join(question.casefold().split())
+
+
+def answer_key(cache, model_name, image_bytes, question):
+    return cache.make_key(model_name, [hashlib.sha256(image_bytes).hexdigest(), normalize_question(question)])
+
+
+def answer_cache_from_env():
+    return ResponseCache(
+        path=os.getenv("ANSWER_CACHE_PATH") or None,
+        max_memory_entries=int(os.getenv("ANSWER_CACHE_MEMORY_ENTRIES", 1024)),
+        max_disk_entries=int(os.getenv("ANSWER_CACHE_DISK_ENTRIES", 100000)),
+        ttl=float(os.getenv("ANSWER_CACHE_TTL", 24 * 3600)),
+        enabled=os.getenv("ANSWER_CACHE", "on").lower() not in ("0", "off", "false"),
+    )
+
+
+class SingleFlight:
+    """Runs at most one call per key at a time; callers arriving meanwhile share its result."""
+
+    def __init__(self):
+        self._calls = {}
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def run(self, key, func):
+        """Await func() or the call already in flight for key; returns (result, shared).
+
+        The call is shielded, so a caller that disconnects does not cancel it
+        for the others.
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            return await asyncio.shield(task), True
+        task = asyncio.ensure_future(func())
+        self._calls[key] = task
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(task), False
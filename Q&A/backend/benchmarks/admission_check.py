@@ -0,0 +1,104 @@
+"""Check admission control: a burst beyond the queue is shed, oversized uploads and pixel bombs are refused.
+
+Usage: python benchmarks/admission_check.py [--requests 12] [--concurrency 2] [--queue 4] [--latency 0.5]
+
+Runs the app under uvicorn with a stub model and a small admission limit,
+sends a burst of concurrent requests and prints how many were answered and
+how many were shed with 429, with the Retry-After they got, the peak queue
+depth and the shed counter from /metrics. Then it sends an upload over UPLOAD_MAX_BYTES, with
+and without a Content-Length, and a small PNG whose header declares more than
+IMAGE_MAX_DECODE_PIXELS pixels.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from collections import Counter
+from io import BytesIO
+
+import httpx
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_model import StubModel, image_server, sample_image, serve
+from fetcher import ImageFetcher
+from main import admission, app
+from admission import upload_max_bytes
+import images
+
+
+def pixel_bomb():
+    """A PNG of a few KB that decodes to more pixels than the cap."""
+    side = int(images.MAX_DECODE_PIXELS ** 0.5) + 1000
+    buffer = BytesIO()
+    Image.MAX_IMAGE_PIXELS = None
+    Image.new("1", (side, side)).save(buffer, format="PNG")
+    Image.MAX_IMAGE_PIXELS = images.MAX_DECODE_PIXELS
+    return buffer.getvalue()
+
+
+async def run(requests, concurrency, queue, latency):
+    image = sample_image()
+    app.state.model = StubModel(latency)
+    app.state.http = image_server(image)
+    app.state.fetcher = ImageFetcher(app.state.http, cache_dir=None)
+    admission.max_concurrent = concurrency
+    admission.max_queue = queue
+
+    async with serve(app) as base_url, httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        async def one(i):
+            files = {"image": ("sample.jpg", image, "image/jpeg")}
+            response = await client.post("/analyze", data={"question": f"Question {i}"}, files=files)
+            return response.status_code, response.headers.get("retry-after")
+
+        async def watch_queue(peak):
+            while True:
+                peak.append(admission.stats()["queue_depth"])
+                await asyncio.sleep(0.01)
+
+        peak = []
+        watcher = asyncio.create_task(watch_queue(peak))
+        results = await asyncio.gather(*(one(i) for i in range(requests)))
+        watcher.cancel()
+        statuses = Counter(status for status, _ in results)
+        retry_after = sorted({value for status, value in results if status == 429})
+        print(f"{requests} concurrent requests, {concurrency} at a time, queue of {queue}:")
+        print(f"  statuses {dict(statuses)}, Retry-After {retry_after}, peak queue depth {max(peak)}")
+        assert statuses[200] == concurrency + queue and statuses[429] == requests - concurrency - queue, statuses
+
+        metrics = (await client.get("/metrics")).text
+        print("  " + "\n  ".join(line for line in metrics.splitlines() if line.startswith("admission_shed")))
+
+        big = b"\0" * (upload_max_bytes() + 1)
+        response = await client.post("/analyze", data={"question": "q"}, files={"image": ("big.jpg", big, "image/jpeg")})
+        print(f"upload over the size cap: {response.status_code} {response.json()['detail']}")
+        assert response.status_code == 413
+
+        async def chunked():
+            yield b'--x\r\nContent-Disposition: form-data; name="image"; filename="big.jpg"\r\n\r\n'
+            for start in range(0, len(big), 1024 * 1024):
+                yield big[start:start + 1024 * 1024]
+            yield b"\r\n--x--\r\n"
+        response = await client.post("/analyze", content=chunked(), headers={"content-type": "multipart/form-data; boundary=x"})
+        print(f"chunked upload over the size cap: {response.status_code} {response.json()['detail']}")
+        assert response.status_code == 413
+
+        bomb = pixel_bomb()
+        response = await client.post("/analyze", data={"question": "q"}, files={"image": ("bomb.png", bomb, "image/png")})
+        print(f"{len(bomb) // 1024} KB PNG over the pixel cap: {response.status_code} {response.json()['detail']}")
+        assert response.status_code == 413
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=12)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--queue", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub model latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.concurrency, args.queue, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Check the /analyze answer cache and request merging against a stub model that counts its calls.
+
+Usage: python benchmarks/answer_cache_check.py [--concurrency 10] [--latency 0.2]
+
+Sends a burst of identical concurrent requests, repeats them, and varies the
+question's case and spacing, the image and the question. Prints the X-Cache
+header of each phase and how many times the model was called, and fails if
+those counts are not what the cache promises.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from collections import Counter
+from io import BytesIO
+
+import httpx
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_model import StubModel, image_server, sample_image
+from fetcher import ImageFetcher
+from main import app, answer_cache
+
+
+async def run(concurrency, latency):
+    model = StubModel(latency)
+    image = sample_image()
+    buffer = BytesIO()
+    Image.new("RGB", (320, 240), (250, 20, 20)).save(buffer, format="PNG")
+    other_image = buffer.getvalue()
+    app.state.model = model
+    app.state.http = image_server(image)
+    app.state.fetcher = ImageFetcher(app.state.http, cache_dir=None)
+    answer_cache.clear()
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        async def ask(question, contents=image, url=None):
+            if url:
+                response = await client.post("/analyze", data={"question": question, "image_url": url})
+            else:
+                files = {"image": ("image", contents, "application/octet-stream")}
+                response = await client.post("/analyze", data={"question": question}, files=files)
+            response.raise_for_status()
+            return response.headers["x-cache"]
+
+        async def phase(name, expected_calls, *requests):
+            before = model.calls
+            statuses = await asyncio.gather(*requests)
+            calls = model.calls - before
+            print(f"{name:<40} {dict(Counter(statuses))!s:<28} model calls: {calls}")
+            assert calls == expected_calls, f"{name}: expected {expected_calls} model calls, got {calls}"
+
+        question = "What color is the sky?"
+        await phase("concurrent identical requests", 1, *(ask(question) for _ in range(concurrency)))
+        await phase("same requests again", 0, *(ask(question) for _ in range(concurrency)))
+        await phase("same image by URL", 0, ask(question, url="http://images.local/sample.jpg"))
+        await phase("question case and spacing changed", 0, ask("  what COLOR is the   sky? "))
+        await phase("different question", 1, ask("Is there a cat?"))
+        await phase("different image", 1, ask(question, contents=other_image))
+    await app.state.http.aclose()
+    print(f"cache stats: {answer_cache.stats()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--latency", type=float, default=0.2, help="Stub model latency in seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args.concurrency, args.latency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Check ImageFetcher against a local HTTP server that counts how often it is hit.
+
+Usage: python benchmarks/fetcher_check.py
+
+The server serves one image with an ETag, one with Last-Modified, one with
+Cache-Control max-age, plus a text page, an oversized image and a slow one.
+Each check prints the number of requests and 200 responses the server saw,
+and fails if they are not what the fetcher's cache and limits promise.
+"""
+import asyncio
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_model import sample_image
+from fetcher import FetchError, ImageFetcher
+
+IMAGE = sample_image()
+LAST_MODIFIED = "Mon, 05 Oct 2026 10:00:00 GMT"
+MAX_BYTES = 64 * 1024
+TIMEOUT = 0.5
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests = Counter()
+    downloads = Counter()
+
+    def do_GET(self):
+        Handler.requests[self.path] += 1
+        headers = {"Content-Type": "image/jpeg"}
+        body = IMAGE
+        if self.path == "/etag.jpg":
+            headers["ETag"] = '"v1"'
+            if self.headers.get("If-None-Match") == '"v1"':
+                return self.reply(304, headers, b"")
+        elif self.path == "/last-modified.jpg":
+            headers["Last-Modified"] = LAST_MODIFIED
+            if self.headers.get("If-Modified-Since") == LAST_MODIFIED:
+                return self.reply(304, headers, b"")
+        elif self.path == "/max-age.jpg":
+            headers["Cache-Control"] = "max-age=60"
+        elif self.path == "/page.html":
+            headers["Content-Type"] = "text/html"
+            body = b"<html>" + b"x" * 100000 + b"</html>"
+        elif self.path == "/huge.jpg":
+            body = IMAGE * (MAX_BYTES // len(IMAGE) + 2)
+        elif self.path == "/slow.jpg":
+            time.sleep(TIMEOUT * 2)
+        Handler.downloads[self.path] += 1
+        self.reply(200, headers, body)
+
+    def reply(self, status, headers, body):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        try:
+            self.wfile.write(body)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+async def run(base_url, cache_dir):
+    async with httpx.AsyncClient() as client:
+        fetcher = ImageFetcher(client, cache_dir=cache_dir, max_bytes=MAX_BYTES, timeout=TIMEOUT)
+
+        async def check(name, path, times, expected_requests, expected_downloads, error=None):
+            before = Handler.requests[path], Handler.downloads[path]
+            for _ in range(times):
+                try:
+                    assert await fetcher.fetch(base_url + path) == IMAGE
+                    outcome = "ok"
+                except FetchError as e:
+                    outcome = f"{e.status_code} {e}"
+            requests = Handler.requests[path] - before[0]
+            downloads = Handler.downloads[path] - before[1]
+            print(f"{name:<38} requests: {requests}  200 responses: {downloads}  -> {outcome}")
+            assert (requests, downloads) == (expected_requests, expected_downloads), name
+            assert outcome == "ok" if error is None else outcome.startswith(error), outcome
+
+        await check("ETag, fetched 3 times", "/etag.jpg", 3, 3, 1)
+        await check("Last-Modified, fetched 3 times", "/last-modified.jpg", 3, 3, 1)
+        await check("max-age=60, fetched 3 times", "/max-age.jpg", 3, 1, 1)
+        await check("text/html is rejected", "/page.html", 1, 1, 1, error="415")
+        await check("body over the byte limit", "/huge.jpg", 1, 1, 1, error="413")
+        await check("slow server hits the deadline", "/slow.jpg", 1, 1, 0, error="504")
+
+        # A new fetcher on the same directory, as after a restart, still revalidates instead of downloading
+        fetcher = ImageFetcher(client, cache_dir=cache_dir, max_bytes=MAX_BYTES, timeout=TIMEOUT)
+        await check("ETag after restart", "/etag.jpg", 1, 1, 0)
+        print(f"fetcher stats: {fetcher.stats()}")
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            asyncio.run(run(f"http://127.0.0.1:{server.server_port}", cache_dir))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
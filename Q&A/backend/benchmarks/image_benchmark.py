@@ -0,0 +1,78 @@
+"""Compare image preprocessing with the old path of decoding in full and letting the SDK encode.
+
+Usage: python benchmarks/image_benchmark.py [--max-pixels 2000000] [--synthetic 12MP]
+
+Runs over the images in Q&A/examples/images and over synthetic photo-like
+JPEG and PNG images of the given sizes. The baseline decodes the whole image
+and encodes it as lossless WebP, which is what google-generativeai does with a
+PIL image before uploading it.
+"""
+import argparse
+import os
+import sys
+import time
+from io import BytesIO
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from images import preprocess_image
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "examples", "images")
+ASPECT = (4, 3)
+
+
+def synthetic_image(megapixels, fmt):
+    """A noisy gradient, which compresses roughly like a photo."""
+    height = int((megapixels * 1_000_000 * ASPECT[1] / ASPECT[0]) ** 0.5)
+    width = height * ASPECT[0] // ASPECT[1]
+    gradient = Image.linear_gradient("L").resize((width, height))
+    noise = Image.effect_noise((width, height), 40)
+    img = Image.merge("RGB", (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    buffer = BytesIO()
+    img.save(buffer, format=fmt, **({"quality": 92} if fmt == "JPEG" else {}))
+    return buffer.getvalue()
+
+
+def baseline(contents):
+    img = Image.open(BytesIO(contents))
+    img.load()
+    buffer = BytesIO()
+    img.save(buffer, format="webp", lossless=True)
+    return len(buffer.getvalue()), img.width * img.height
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--max-pixels", type=int, default=2_000_000)
+    parser.add_argument("--synthetic", default="12MP", help="Sizes of the synthetic images in megapixels")
+    args = parser.parse_args()
+
+    cases = []
+    for name in sorted(os.listdir(EXAMPLES)):
+        with open(os.path.join(EXAMPLES, name), "rb") as f:
+            cases.append((name, f.read()))
+    for label in filter(None, args.synthetic.split(",")):
+        megapixels = float(label.upper().rstrip("MP"))
+        for fmt in ("JPEG", "PNG"):
+            cases.append((f"synthetic {label} {fmt}", synthetic_image(megapixels, fmt)))
+
+    print(f"{'image':<22} {'input':>9} {'pixels':>11} | {'baseline':>8} {'sent':>9} | {'prep':>8} {'sent':>9} {'pixels':>11} {'speedup':>8}")
+    for name, contents in cases:
+        (base_bytes, base_pixels), base_time = timed(baseline, contents)
+        prepared, prep_time = timed(preprocess_image, contents, args.max_pixels)
+        print(
+            f"{name:<22} {len(contents) / 1024:>7.0f}KB {base_pixels:>11,} | {base_time:>7.3f}s {base_bytes / 1024:>7.0f}KB | "
+            f"{prep_time:>7.3f}s {len(prepared.data) / 1024:>7.0f}KB {prepared.pixels:>11,} {base_time / prep_time:>7.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Load test /analyze against a stub Gemini model to check that requests overlap.
+
+Usage: python benchmarks/load_test.py [--requests 20] [--latency 0.5] [--blocking] [--stream]
+
+The app runs under uvicorn on a local port. The stub answers after --latency
+seconds and the image URL is served from memory after a short delay, so no
+network access or API key is needed. With
+the async model call, N concurrent requests finish in about one latency;
+--blocking makes the stub sleep on the event loop like the old synchronous
+generate_content, and the same requests then take N latencies. --stream
+uses /analyze/stream, where the stub sends its answer in several chunks, and
+also reports the time to the first chunk.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GOOGLE_API_KEY", "stub")
+
+from stub_model import StubModel, image_server, sample_image, serve
+from fetcher import ImageFetcher
+from main import app
+
+
+async def run(requests, latency, blocking, stream=False):
+    """Send the requests concurrently; returns (wall time, time to first chunk of each request)."""
+    image = sample_image()
+    app.state.model = StubModel(latency, blocking)
+    app.state.http = image_server(image)
+    app.state.fetcher = ImageFetcher(app.state.http, cache_dir=None)
+    first_chunks = []
+
+    async def one(client, i):
+        data = {"question": f"What is in image {i}?"}
+        files = None
+        if i % 2:
+            data["image_url"] = "http://images.local/sample.jpg"
+        else:
+            files = {"image": ("sample.jpg", image, "image/jpeg")}
+        if not stream:
+            response = await client.post("/analyze", data=data, files=files)
+            response.raise_for_status()
+            return
+        sent = time.perf_counter()
+        async with client.stream("POST", "/analyze/stream", data=data, files=files) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if sent is not None and line.startswith("data:"):
+                    first_chunks.append(time.perf_counter() - sent)
+                    sent = None
+
+    async with serve(app) as base_url, httpx.AsyncClient(base_url=base_url, timeout=None) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(one(client, i) for i in range(requests)))
+        elapsed = time.perf_counter() - start
+    return elapsed, first_chunks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub model latency in seconds")
+    parser.add_argument("--blocking", action="store_true", help="Block the event loop like a synchronous model call")
+    parser.add_argument("--stream", action="store_true", help="Use the streaming endpoint")
+    args = parser.parse_args()
+
+    elapsed, first_chunks = asyncio.run(run(args.requests, args.latency, args.blocking, args.stream))
+    serialized = args.requests * args.latency
+    print(f"{args.requests} concurrent requests, {args.latency:.2f}s model latency ({'blocking' if args.blocking else 'async'} stub)")
+    print(f"wall time {elapsed:.2f}s, {args.requests / elapsed:.1f} req/s")
+    print(f"fully serialized would take {serialized:.2f}s; overlap factor {serialized / elapsed:.1f}x")
+    if first_chunks:
+        print(f"time to first chunk: mean {sum(first_chunks) / len(first_chunks):.3f}s, max {max(first_chunks):.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Local stand-ins for Gemini and for image servers, shared by the benchmark scripts.
+
+StubModel answers after a configurable latency, optionally with jitter, in
+chunks when asked to stream. It can also inject failures:
+
+- failure_rate: the fraction of calls that raise. A streamed answer fails
+  halfway through instead, after some text has been sent.
+- blocked_rate: the fraction of answers whose .text raises ValueError, as
+  Gemini's does for a blocked answer. The app then falls back to a
+  text-only prompt.
+
+serve() runs an app under uvicorn on a free local port.
+"""
+import asyncio
+import contextlib
+import os
+import random
+import sys
+import time
+from io import BytesIO
+
+import httpx
+import uvicorn
+from PIL import Image
+
+# Scripts importing this module can then import the app's modules, and main needs no real key
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GOOGLE_API_KEY", "stub")
+
+FETCH_LATENCY = 0.05
+
+
+class InjectedFailure(RuntimeError):
+    pass
+
+
+class StubResponse:
+    def __init__(self, text, blocked=False):
+        self._text = text
+        self.blocked = blocked
+
+    @property
+    def text(self):
+        if self.blocked:
+            raise ValueError("The response was blocked by the stub model")
+        return self._text
+
+
+class StubStream:
+    """Async iterator over the chunks of a streamed stub answer."""
+
+    def __init__(self, text, latency, chunks, blocked=False, fail=False):
+        self.words = text.split(" ")
+        self.latency = latency
+        self.chunks = chunks
+        self.blocked = blocked
+        self.fail = fail
+
+    async def __aiter__(self):
+        size = -(-len(self.words) // self.chunks)
+        for n, i in enumerate(range(0, len(self.words), size)):
+            await asyncio.sleep(self.latency / self.chunks)
+            if self.fail and n == self.chunks // 2:
+                raise InjectedFailure("Injected failure in the stub model stream")
+            yield StubResponse(" ".join(self.words[i:i + size]) + " ", self.blocked)
+
+
+class StubModel:
+    """Stands in for genai.GenerativeModel with a set latency, streaming and failure injection."""
+
+    def __init__(self, latency, blocking=False, chunks=10, jitter=0.0, failure_rate=0.0, blocked_rate=0.0, seed=None):
+        self.latency = latency
+        self.blocking = blocking
+        self.chunks = chunks
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.blocked_rate = blocked_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+        self.failures = 0
+        self.blocked = 0
+
+    async def generate_content_async(self, contents, stream=False):
+        self.calls += 1
+        prompt = contents[0] if isinstance(contents, list) else contents
+        text = (f"Stub answer to: {prompt} " + "lorem ipsum " * 20).strip()
+        latency = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+        fail = self.random.random() < self.failure_rate
+        blocked = not fail and self.random.random() < self.blocked_rate
+        self.failures += fail
+        self.blocked += blocked
+        if stream:
+            return StubStream(text, latency, self.chunks, blocked, fail)
+        if self.blocking:
+            time.sleep(latency)
+        else:
+            await asyncio.sleep(latency)
+        if fail:
+            raise InjectedFailure("Injected failure in the stub model")
+        return StubResponse(text, blocked)
+
+    def stats(self):
+        return {"calls": self.calls, "failures": self.failures, "blocked": self.blocked}
+
+
+def sample_image(size=(640, 480), color=(120, 180, 240)):
+    buffer = BytesIO()
+    Image.new("RGB", size, color).save(buffer, format="JPEG")
+    return buffer.getvalue()
+
+
+def image_server(image):
+    """An httpx client that answers every URL with the image after FETCH_LATENCY seconds."""
+    async def handler(request):
+        await asyncio.sleep(FETCH_LATENCY)
+        return httpx.Response(200, content=image, headers={"content-type": "image/jpeg"})
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+@contextlib.asynccontextmanager
+async def serve(app):
+    """Run the app with uvicorn on a free local port; yields its base URL."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        await task
@@ -0,0 +1,399 @@
+"""Benchmark the backend at several concurrency levels against the stub model and a local image server.
+
+Usage: python benchmarks/suite.py [--concurrency 1,8,32] [--requests 200] [--mix upload=5,url=3,stream=2]
+                                  [--images examples] [--questions FILE] [--unique 0.5]
+                                  [--latency 0.5] [--jitter 0.2] [--failure-rate 0] [--blocked-rate 0]
+                                  [--output results.json] [--compare old.json]
+
+The app runs under uvicorn in a thread of its own with the stub model from
+stub_model.py on app.state.model. URL images come from a local HTTP server
+that sends an ETag, so they go through the fetcher and its disk cache. Each level
+sends --requests requests from that many concurrent clients. The requests are
+drawn from the --mix of kinds:
+
+- upload: POST /analyze with an uploaded image
+- url: POST /analyze with an image_url
+- stream: POST /analyze/stream with an uploaded image
+- batch: POST /analyze/batch with two images and two questions
+
+Images are picked from --images: "examples" for Q&A/examples/images and sizes
+such as 12MP for synthetic photos. Questions are picked from --questions (one
+per line) or a built-in list. A --unique fraction of them is made unique so
+it misses the answer cache; the answer cache is emptied before each level.
+The plan is drawn from --seed, so two runs send the same requests.
+
+Each level reports p50/p95/p99 latency, requests per second, the status
+codes, the answers that failed or fell back, time to first chunk for streams,
+and the peak resident memory of the process (server and clients) during the
+level. --output writes everything as JSON, and --compare prints the
+change from an earlier JSON file.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import uvicorn
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_model import StubModel
+from image_benchmark import EXAMPLES, synthetic_image
+from fetcher import ImageFetcher
+from main import answer_cache, app
+
+KINDS = ("upload", "url", "stream", "batch")
+QUESTIONS = [
+    "What is in this image?",
+    "Describe the scene in one sentence.",
+    "What colors stand out?",
+    "Is there a person in the picture?",
+    "What text can you read?",
+    "Where might this photo have been taken?",
+    "How many objects are visible?",
+    "What is the mood of this image?",
+]
+
+
+def load_images(spec):
+    images = []
+    for label in filter(None, spec.split(",")):
+        if label == "examples":
+            for name in sorted(os.listdir(EXAMPLES)):
+                with open(os.path.join(EXAMPLES, name), "rb") as f:
+                    images.append((name, f.read()))
+        else:
+            images.append((f"synthetic-{label}.jpg", synthetic_image(float(label.upper().rstrip("MP")), "JPEG")))
+    return images
+
+
+def parse_mix(spec):
+    mix = {}
+    for part in filter(None, spec.split(",")):
+        kind, _, weight = part.partition("=")
+        if kind not in KINDS:
+            raise SystemExit(f"Unknown request kind {kind!r}; use {', '.join(KINDS)}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def plan(count, mix, images, questions, unique, rng):
+    """The requests of one level as (kind, image indexes, questions)."""
+    def question(i):
+        text = rng.choice(questions)
+        return f"{text} (request {i})" if rng.random() < unique else text
+
+    requests = []
+    for i in range(count):
+        kind = rng.choices(list(mix), weights=list(mix.values()))[0]
+        if kind == "batch":
+            requests.append((kind, rng.sample(range(len(images)), min(2, len(images))), [question(i), question(i)]))
+        else:
+            requests.append((kind, [rng.randrange(len(images))], [question(i)]))
+    return requests
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serves /<index> from the image list with an ETag, answering revalidations with 304."""
+
+    images = []
+
+    def do_GET(self):
+        name, body = self.images[int(self.path.strip("/"))]
+        etag = f'"{self.path.strip("/")}"'
+        if self.headers.get("If-None-Match") == etag:
+            self.send_response(304)
+            body = b""
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "image/png" if name.endswith(".png") else "image/jpeg")
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def rss_bytes():
+    """Resident memory of this process; the lifetime peak where /proc is not available."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class MemorySampler:
+    """Samples resident memory in a background thread while in use; .peak is the highest seen."""
+
+    def __init__(self, interval=0.02):
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+
+    def _run(self):
+        while True:
+            self.peak = max(self.peak, rss_bytes())
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self.peak = rss_bytes()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+@contextlib.contextmanager
+def serve_in_thread(app):
+    """Run the app under uvicorn on its own event loop in a thread; yields its base URL.
+
+    Keeping the server off the clients' event loop stops the load generator's
+    own work from showing up as server latency.
+    """
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("The server failed to start")
+        time.sleep(0.01)
+    port = server.servers[0].sockets[0].getsockname()[1]
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def at(p):
+        # Linear interpolation between the closest ranks
+        position = (len(values) - 1) * p / 100
+        low = int(position)
+        high = min(low + 1, len(values) - 1)
+        return values[low] + (values[high] - values[low]) * (position - low)
+
+    return {
+        "p50": at(50),
+        "p95": at(95),
+        "p99": at(99),
+        "mean": sum(values) / len(values),
+        "max": values[-1],
+    }
+
+
+async def send(client, kind, image_indexes, questions, images, image_base):
+    """Send one request; returns (status code, outcome, time to first chunk)."""
+    files = [("image", images[i]) for i in image_indexes]
+    if kind == "url":
+        data = {"question": questions[0], "image_url": f"{image_base}/{image_indexes[0]}"}
+        response = await client.post("/analyze", data=data)
+    elif kind == "upload":
+        response = await client.post("/analyze", data={"question": questions[0]}, files=files)
+    elif kind == "batch":
+        files = [("images", images[i]) for i in image_indexes]
+        response = await client.post("/analyze/batch", data={"questions": questions}, files=files)
+    else:
+        return await send_stream(client, questions[0], files)
+
+    if response.status_code != 200:
+        return response.status_code, "error", None
+    body = response.json()
+    if kind == "batch":
+        outcomes = {result["status"] for result in body["results"]}
+        return 200, "error" if "error" in outcomes else "ok", None
+    return 200, "fallback" if "error" in body else "ok", None
+
+
+async def send_stream(client, question, files):
+    sent = time.perf_counter()
+    first_chunk = None
+    event = None
+    outcome = "error"
+    async with client.stream("POST", "/analyze/stream", data={"question": question}, files=files) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return response.status_code, "error", None
+        async for line in response.aiter_lines():
+            if line.startswith("event:"):
+                event = line.split(":", 1)[1].strip()
+            elif line.startswith("data:"):
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - sent
+                if event == "done":
+                    outcome = "fallback" if "error" in json.loads(line[5:]) else "ok"
+            elif not line:
+                event = None
+    return 200, outcome, first_chunk
+
+
+async def run_level(base_url, concurrency, requests, images, image_base):
+    answer_cache.clear()
+    pending = iter(requests)
+    latencies = []
+    first_chunks = []
+    statuses = Counter()
+    outcomes = Counter()
+    kinds = Counter()
+    limits = httpx.Limits(max_connections=None, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, limits=limits) as client:
+        async def worker():
+            for kind, image_indexes, questions in pending:
+                start = time.perf_counter()
+                try:
+                    status, outcome, first_chunk = await send(client, kind, image_indexes, questions, images, image_base)
+                except httpx.HTTPError:
+                    status, outcome, first_chunk = 0, "error", None
+                latencies.append(time.perf_counter() - start)
+                statuses[status] += 1
+                outcomes[outcome] += 1
+                kinds[kind] += 1
+                if first_chunk is not None:
+                    first_chunks.append(first_chunk)
+
+        with MemorySampler() as memory:
+            start = time.perf_counter()
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+
+    return {
+        "concurrency": concurrency,
+        "requests": len(requests),
+        "seconds": elapsed,
+        "rps": len(requests) / elapsed,
+        "latency": percentiles(latencies),
+        "first_chunk": percentiles(first_chunks),
+        "statuses": {str(status): n for status, n in sorted(statuses.items())},
+        "outcomes": dict(outcomes),
+        "kinds": dict(kinds),
+        "cache": answer_cache.stats(),
+        "peak_rss_bytes": memory.peak,
+    }
+
+
+def print_level(level):
+    latency = level["latency"]
+    print(
+        f"{level['concurrency']:>5} {level['requests']:>6} {level['rps']:>8.1f} "
+        f"{latency['p50'] * 1000:>8.0f} {latency['p95'] * 1000:>8.0f} {latency['p99'] * 1000:>8.0f} "
+        f"{level['peak_rss_bytes'] / 1024 ** 2:>9.0f}  "
+        f"{' '.join(f'{status}:{n}' for status, n in level['statuses'].items())}  "
+        f"{' '.join(f'{outcome}:{n}' for outcome, n in sorted(level['outcomes'].items()))}"
+        + (f"  first chunk p50 {level['first_chunk']['p50'] * 1000:.0f}ms" if level["first_chunk"] else "")
+    )
+
+
+def compare(levels, path):
+    with open(path) as f:
+        before = {level["concurrency"]: level for level in json.load(f)["levels"]}
+    print(f"\nchange from {path}:")
+    print(f"{'conc':>5} {'req/s':>22} {'p95 ms':>22} {'peak MB':>22}")
+
+    def change(old, new, digits=0):
+        percent = f"{(new - old) / old:+.0%}" if old else ""
+        return f"{old:>7.{digits}f} -> {new:<7.{digits}f}{percent:>6}"
+
+    for level in levels:
+        old = before.get(level["concurrency"])
+        if old is None:
+            continue
+        print(
+            f"{level['concurrency']:>5} {change(old['rps'], level['rps'], 1):>22} "
+            f"{change(old['latency']['p95'] * 1000, level['latency']['p95'] * 1000):>22} "
+            f"{change(old['peak_rss_bytes'] / 1024 ** 2, level['peak_rss_bytes'] / 1024 ** 2):>22}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated numbers of concurrent clients")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--mix", default="upload=5,url=3,stream=2", help=f"Weights of the request kinds ({', '.join(KINDS)})")
+    parser.add_argument("--images", default="examples", help='"examples" and/or synthetic sizes such as 12MP')
+    parser.add_argument("--questions", help="File with one question per line")
+    parser.add_argument("--unique", type=float, default=0.5, help="Fraction of questions made unique to miss the answer cache")
+    parser.add_argument("--latency", type=float, default=0.5, help="Stub model latency in seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="Random +/- seconds added to each stub call")
+    parser.add_argument("--chunks", type=int, default=10, help="Chunks per streamed stub answer")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of stub calls that fail")
+    parser.add_argument("--blocked-rate", type=float, default=0.0, help="Fraction of stub answers that are blocked")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    images = load_images(args.images)
+    questions = QUESTIONS
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+    rng = random.Random(args.seed)
+    model = StubModel(args.latency, chunks=args.chunks, jitter=args.jitter, failure_rate=args.failure_rate,
+                      blocked_rate=args.blocked_rate, seed=args.seed)
+
+    ImageHandler.images = images
+    image_server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    threading.Thread(target=image_server.serve_forever, daemon=True).start()
+    image_base = f"http://127.0.0.1:{image_server.server_port}"
+
+    print(f"{len(images)} images, {len(questions)} questions, mix {mix}, stub latency {args.latency}s +/- {args.jitter}s")
+    print(f"{'conc':>5} {'reqs':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak MB':>9}  statuses  outcomes")
+    levels = []
+    try:
+        with tempfile.TemporaryDirectory() as cache_dir:
+            app.state.model = model
+            app.state.http = httpx.AsyncClient(timeout=10)
+            app.state.fetcher = ImageFetcher(app.state.http, cache_dir=cache_dir)
+            with serve_in_thread(app) as base_url:
+                for concurrency in (int(n) for n in args.concurrency.split(",")):
+                    requests = plan(args.requests, mix, images, questions, args.unique, rng)
+                    before = model.stats(), app.state.fetcher.stats()
+                    level = asyncio.run(run_level(base_url, concurrency, requests, images, image_base))
+                    # Counts for this level alone
+                    level["model"] = {k: v - before[0][k] for k, v in model.stats().items()}
+                    level["fetcher"] = {k: v - before[1][k] for k, v in app.state.fetcher.stats().items()}
+                    levels.append(level)
+                    print_level(level)
+    finally:
+        image_server.shutdown()
+
+    if args.output:
+        config = {k: v for k, v in vars(args).items() if k not in ("output", "compare")}
+        environment = {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()}
+        with open(args.output, "w") as f:
+            json.dump({"config": config, "environment": environment, "levels": levels}, f, indent=2)
+        print(f"\nresults written to {args.output}")
+    if args.compare:
+        compare(levels, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,217 @@
+"""Downloads images from URLs for /analyze.
+
+ImageFetcher streams the body through the app's pooled httpx client. It stops
+at FETCH_MAX_BYTES and at a FETCH_TIMEOUT deadline, and it rejects content that
+is not an image before reading the body. Responses are cached on disk, keyed by
+URL (FETCH_CACHE_DIR). A cached copy is reused without a request while its
+Cache-Control max-age lasts. After that it is revalidated with If-None-Match /
+If-Modified-Since, so an unchanged image costs a 304 instead of a download.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import httpx
+from starlette.concurrency import run_in_threadpool
+
+# Leading bytes of the image formats we decode, for servers that send application/octet-stream
+SIGNATURES = (b"\xff\xd8\xff", b"\x89PNG\r\n\x1a\n", b"GIF87a", b"GIF89a", b"BM", b"II*\x00", b"MM\x00*")
+
+
+class FetchError(Exception):
+    """A URL that could not be used; status_code is the HTTP status to answer with."""
+
+    def __init__(self, message, status_code=502):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def looks_like_image(data):
+    return data.startswith(SIGNATURES) or (data[:4] == b"RIFF" and data[8:12] == b"WEBP")
+
+
+def max_age(headers):
+    """Seconds the response may be reused without revalidation; None if it must not be stored."""
+    directives = {}
+    for part in headers.get("cache-control", "").lower().split(","):
+        name, _, value = part.strip().partition("=")
+        directives[name] = value
+    if "no-store" in directives:
+        return None
+    if "no-cache" in directives:
+        return 0
+    try:
+        return max(0, int(directives.get("max-age", 0)))
+    except ValueError:
+        return 0
+
+
+class ImageFetcher:
+    """Fetches image URLs with a size cap, a deadline and a revalidating disk cache."""
+
+    def __init__(self, client, cache_dir=".fetch_cache", max_bytes=20 * 1024 * 1024, timeout=10.0,
+                 cache_max_bytes=500 * 1024 * 1024):
+        self.client = client
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.cache_max_bytes = cache_max_bytes
+        self.downloads = 0
+        self.revalidated = 0
+        self.fresh_hits = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    async def fetch(self, url):
+        """Return the image bytes at url; raises FetchError."""
+        if not url.startswith(("http://", "https://")):
+            raise FetchError("Only http and https image URLs are supported", 400)
+        cached = await run_in_threadpool(self._load, url) if self.cache_dir else None
+        if cached is not None and time.time() < cached[0]["expires"]:
+            self.fresh_hits += 1
+            return cached[1]
+        try:
+            return await asyncio.wait_for(self._download(url, cached), self.timeout)
+        except asyncio.TimeoutError:
+            raise FetchError(f"Image URL did not respond within {self.timeout:g}s", 504)
+        except httpx.HTTPError as e:
+            raise FetchError(f"Could not fetch image URL: {str(e)}")
+
+    async def _download(self, url, cached):
+        headers = {}
+        if cached is not None:
+            meta, body = cached
+            if meta.get("etag"):
+                headers["If-None-Match"] = meta["etag"]
+            if meta.get("last_modified"):
+                headers["If-Modified-Since"] = meta["last_modified"]
+
+        async with self.client.stream("GET", url, headers=headers) as response:
+            if response.status_code == 304 and cached is not None:
+                self.revalidated += 1
+                await run_in_threadpool(self._touch, url, meta, response.headers)
+                return body
+            if response.status_code != 200:
+                raise FetchError(f"Image URL returned HTTP {response.status_code}")
+            body = await self._read(response)
+
+        self.downloads += 1
+        if self.cache_dir:
+            await run_in_threadpool(self._store, url, response.headers, body)
+        return body
+
+    async def _read(self, response):
+        content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+        if not content_type.startswith("image/") and content_type not in ("", "application/octet-stream"):
+            raise FetchError(f"URL is not an image (content type {content_type})", 415)
+        length = response.headers.get("content-length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            raise FetchError(f"Image is larger than {self.max_bytes} bytes", 413)
+
+        chunks = []
+        size = 0
+        async for chunk in response.aiter_bytes():
+            size += len(chunk)
+            if size > self.max_bytes:
+                raise FetchError(f"Image is larger than {self.max_bytes} bytes", 413)
+            chunks.append(chunk)
+        body = b"".join(chunks)
+        if not content_type.startswith("image/") and not looks_like_image(body):
+            raise FetchError("URL is not an image", 415)
+        return body
+
+    def stats(self):
+        return {"downloads": self.downloads, "revalidated": self.revalidated, "fresh_hits": self.fresh_hits}
+
+    def _paths(self, url):
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, name + ".json"), os.path.join(self.cache_dir, name + ".body")
+
+    def _load(self, url):
+        meta_path, body_path = self._paths(url)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+            # The body's modification time orders eviction
+            os.utime(body_path)
+        except (OSError, ValueError):
+            return None
+        if meta.get("url") != url or len(body) != meta.get("size"):
+            return None
+        return meta, body
+
+    def _meta(self, url, headers, size):
+        age = max_age(headers)
+        return {
+            "url": url,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "size": size,
+            "expires": time.time() + (age or 0),
+            "cacheable": age is not None,
+        }
+
+    def _store(self, url, headers, body):
+        meta = self._meta(url, headers, len(body))
+        # Without a validator or a max-age a cached copy could never be reused safely
+        if not meta["cacheable"] or not (meta["etag"] or meta["last_modified"] or meta["expires"] > time.time()):
+            return
+        meta_path, body_path = self._paths(url)
+        self._write(body_path, body)
+        self._write(meta_path, json.dumps(meta).encode("utf-8"))
+        self._evict()
+
+    def _touch(self, url, meta, headers):
+        # A 304 may update the freshness lifetime and validators
+        updated = self._meta(url, headers, meta["size"])
+        meta = {**meta, "expires": updated["expires"]}
+        for key in ("etag", "last_modified"):
+            if updated[key]:
+                meta[key] = updated[key]
+        meta_path, _ = self._paths(url)
+        self._write(meta_path, json.dumps(meta).encode("utf-8"))
+
+    def _write(self, path, data):
+        # Write to a private temporary file and rename, so concurrent fetches never see a partial file
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def _evict(self):
+        """Delete the least recently used bodies until the cache fits in cache_max_bytes."""
+        entries = []
+        total = 0
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".body"):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+                total += stat.st_size
+        for _, size, path in sorted(entries):
+            if total <= self.cache_max_bytes:
+                break
+            for stale in (path, path[:-len(".body")] + ".json"):
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+            total -= size
+
+
+def fetcher_from_env(client):
+    # Read when the app starts rather than on import, so a .env loaded after the import applies
+    return ImageFetcher(
+        client,
+        cache_dir=os.getenv("FETCH_CACHE_DIR", ".fetch_cache"),
+        max_bytes=int(os.getenv("FETCH_MAX_BYTES", 20 * 1024 * 1024)),
+        timeout=float(os.getenv("FETCH_TIMEOUT", 10)),
+        cache_max_bytes=int(os.getenv("FETCH_CACHE_MAX_BYTES", 500 * 1024 * 1024)),
+    )
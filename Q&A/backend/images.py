@@ -0,0 +1,135 @@
+"""Image preprocessing applied before an image is sent to Gemini.
+
+Phone photos are often 12+ megapixels, far more than the model needs. Decoding
+them in full wastes memory, and the SDK re-encodes a decoded PIL image as
+lossless WebP, which is slow and large. preprocess_image() decodes JPEGs at a
+reduced size with Pillow's draft mode and caps the pixel count. It also applies
+the EXIF orientation, converts to RGB and re-encodes as JPEG. The result is
+passed to the model as a {"mime_type", "data"} blob.
+"""
+import math
+import os
+import warnings
+from io import BytesIO
+
+from PIL import ExifTags, Image, ImageOps
+
+MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", 2_000_000))
+MAX_DECODE_PIXELS = int(os.getenv("IMAGE_MAX_DECODE_PIXELS", 64_000_000))
+JPEG_QUALITY = int(os.getenv("IMAGE_JPEG_QUALITY", 85))
+PREPROCESS = os.getenv("IMAGE_PREPROCESS", "on").lower() not in ("0", "off", "false")
+
+# Pillow's own decompression-bomb guard, in line with the cap checked below. Its
+# warning for images just over the limit is redundant, since check_header refuses them.
+Image.MAX_IMAGE_PIXELS = MAX_DECODE_PIXELS
+warnings.filterwarnings("ignore", category=Image.DecompressionBombWarning)
+
+# Formats Gemini accepts as-is, so a small image in one of them can be sent unchanged
+PASSTHROUGH_FORMATS = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+
+
+class ImageTooLarge(ValueError):
+    """The image header declares more pixels than we are willing to decode."""
+
+
+def check_header(source, max_pixels=MAX_DECODE_PIXELS):
+    """Read only the image header from a file object and refuse images with too many pixels.
+
+    Returns (format, size) and leaves the file at its start. Raises
+    ImageTooLarge, or PIL.UnidentifiedImageError for data that is not an image.
+    """
+    try:
+        with Image.open(source) as img:
+            width, height = img.size
+            result = img.format, img.size
+    except Image.DecompressionBombError as e:
+        raise ImageTooLarge(str(e))
+    if width * height > max_pixels:
+        raise ImageTooLarge(f"Image is {width}x{height}, more than {max_pixels} pixels")
+    source.seek(0)
+    return result
+
+
+class PreparedImage:
+    """A preprocessed image with its encoded bytes and before/after sizes."""
+
+    def __init__(self, data, mime_type, size, original_bytes, original_size):
+        self.data = data
+        self.mime_type = mime_type
+        self.size = size
+        self.original_bytes = original_bytes
+        self.original_size = original_size
+
+    @property
+    def pixels(self):
+        return self.size[0] * self.size[1]
+
+    @property
+    def original_pixels(self):
+        return self.original_size[0] * self.original_size[1]
+
+    def blob(self):
+        """The image in the form generate_content accepts."""
+        return {"mime_type": self.mime_type, "data": self.data}
+
+    def stats(self):
+        return {
+            "original_bytes": self.original_bytes,
+            "bytes": len(self.data),
+            "original_pixels": self.original_pixels,
+            "pixels": self.pixels,
+        }
+
+
+def target_size(size, max_pixels):
+    """Largest size with the same aspect ratio and at most max_pixels pixels."""
+    width, height = size
+    if width * height <= max_pixels:
+        return size
+    scale = math.sqrt(max_pixels / (width * height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def to_rgb(img):
+    """Convert to RGB, flattening any transparency onto white."""
+    if img.mode == "RGB":
+        return img
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def preprocess_image(contents, max_pixels=MAX_PIXELS, quality=JPEG_QUALITY):
+    """Downscale, orient and re-encode image bytes; returns a PreparedImage.
+
+    This is CPU-bound, so call it from a worker thread in async code.
+    Raises PIL.UnidentifiedImageError for data that is not an image.
+    """
+    img = Image.open(BytesIO(contents))
+    original_format, original_mode, original_size = img.format, img.mode, img.size
+    orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+    size = target_size(original_size, max_pixels)
+
+    # Let the JPEG decoder scale by 1/2, 1/4 or 1/8 while decoding; it never goes below the requested size
+    if original_format == "JPEG" and size != original_size:
+        img.draft("RGB", size)
+
+    img = to_rgb(ImageOps.exif_transpose(img))
+    if img.width * img.height > max_pixels:
+        img = img.resize(target_size(img.size, max_pixels), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    buffer = BytesIO()
+    img.save(buffer, format="JPEG", quality=quality, optimize=True)
+    data = buffer.getvalue()
+
+    # Re-encoding a small, upright image can make it bigger; keep the original bytes then
+    unchanged = (
+        size == original_size and orientation == 1
+        and original_format in PASSTHROUGH_FORMATS and original_mode in ("RGB", "L")
+    )
+    if unchanged and len(contents) <= len(data):
+        return PreparedImage(contents, PASSTHROUGH_FORMATS[original_format], original_size, len(contents), original_size)
+    return PreparedImage(data, "image/jpeg", img.size, len(contents), original_size)
@@ -1,20 +1,66 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
 import os
+import sys
+import time
 import base64
 from io import BytesIO
 from PIL import Image
-import requests
+import httpx
 from dotenv import load_dotenv
 import google.generativeai as genai
-from typing import Optional
+from typing import List, Optional
+import asyncio
 import json
 
-# Load environment variables
+# Load environment variables before the local modules, which read their settings on import
 load_dotenv()
 
-app = FastAPI()
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from shared import tracing
+import images
+from fetcher import FetchError, fetcher_from_env
+from admission import AdmissionMiddleware, admission_from_env
+from answer_cache import SingleFlight, answer_cache_from_env, answer_key
+
+MODEL_NAME = "gemini-1.5-flash"
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 4))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", 100))
+
+# Initialize Gemini API
+google_api_key = os.getenv("GOOGLE_API_KEY")
+if not google_api_key:
+    raise ValueError("GOOGLE_API_KEY environment variable not set")
+
+genai.configure(api_key=google_api_key)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Created once and shared by every request. A model or client already set on
+    # app.state (e.g. a stub in the load test) is left in place.
+    if getattr(app.state, "model", None) is None:
+        # Using Gemini 1.5 Flash instead of the deprecated Pro Vision
+        app.state.model = genai.GenerativeModel(MODEL_NAME)
+    if getattr(app.state, "http", None) is None:
+        app.state.http = httpx.AsyncClient(
+            timeout=httpx.Timeout(float(os.getenv("FETCH_TIMEOUT", 10))),
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            follow_redirects=True,
+        )
+    if getattr(app.state, "fetcher", None) is None:
+        app.state.fetcher = fetcher_from_env(app.state.http)
+    yield
+    await app.state.http.aclose()
+
+app = FastAPI(lifespan=lifespan)
+
+# Bound the analyze requests running at once and the memory they use; added
+# before CORS so that 429 and 413 responses still carry CORS headers
+admission = admission_from_env()
+app.add_middleware(AdmissionMiddleware, controller=admission)
 
 # Configure CORS
 app.add_middleware(
@@ -23,96 +69,347 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Cache"],
 )
 
-# Initialize Gemini API
-google_api_key = os.getenv("GOOGLE_API_KEY")
-if not google_api_key:
-    raise ValueError("GOOGLE_API_KEY environment variable not set")
+# Answers keyed by image content and question; identical requests in flight share one call
+answer_cache = answer_cache_from_env()
+answer_flights = SingleFlight()
 
-genai.configure(api_key=google_api_key)
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Labelled by route template once routing has run, so raw paths cannot grow the metrics without bound
+    labels = {"path": "unmatched"}
+    with tracing.span("http.request", labels=labels) as span:
+        try:
+            response = await call_next(request)
+            span.set(status=response.status_code)
+        finally:
+            route = request.scope.get("route")
+            if route is not None:
+                labels["path"] = route.path
+    return response
+
+def record_usage(span, response):
+    """Attach the token counts Gemini reports, when the SDK version exposes them."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is not None:
+        span.set(prompt_tokens=usage.prompt_token_count, completion_tokens=usage.candidates_token_count)
+
+def decode_image(contents):
+    """Decode image bytes fully; run in a worker thread so the event loop stays free."""
+    with tracing.span("image.decode", bytes=len(contents)):
+        img = Image.open(BytesIO(contents))
+        img.load()
+    return img
+
+def prepare_image(source):
+    """Turn an uploaded or fetched image file into model input; runs in a worker thread.
+    
+    The header is checked before anything is decoded, so an image with too
+    many pixels is refused without decoding it.
+    
+    Returns (image, image_bytes, stats). image_bytes are the normalized bytes
+    the answer cache key is computed from. stats has the bytes and pixels
+    before and after preprocessing, or is None when IMAGE_PREPROCESS is off.
+    """
+    images.check_header(source)
+    contents = source.read()
+    if not images.PREPROCESS:
+        return decode_image(contents), contents, None
+    with tracing.span("image.preprocess") as span:
+        prepared = images.preprocess_image(contents)
+        stats = prepared.stats()
+        span.set(**stats)
+    tracing.count("image_bytes", stats["original_bytes"], stage="received")
+    tracing.count("image_bytes", stats["bytes"], stage="sent")
+    return prepared.blob(), prepared.data, stats
+
+async def generate(model, contents, model_used=MODEL_NAME):
+    with tracing.span("gemini.generate", labels={"model": model_used}) as span:
+        response = await model.generate_content_async(contents)
+        record_usage(span, response)
+    return response
+
+async def generate_stream(model, contents, model_used=MODEL_NAME):
+    """Yield the answer text chunk by chunk as Gemini generates it."""
+    with tracing.span("gemini.stream", labels={"model": model_used}) as span:
+        start = time.perf_counter()
+        response = await model.generate_content_async(contents, stream=True)
+        first = True
+        async for chunk in response:
+            text = chunk.text
+            if first:
+                tracing.observe("gemini.first_chunk", time.perf_counter() - start, labels={"model": model_used})
+                first = False
+            yield text
+        # The last chunk carries the usage totals
+        if not first:
+            record_usage(span, chunk)
+
+def fallback_prompt(question):
+    return f"I wanted to ask this question about an image: {question}\nHowever, the image analysis failed. Can you help me with what might be a general answer or what information you would need?"
+
+def sse(data, event=None):
+    """Format one Server-Sent Event with a JSON payload."""
+    return (f"event: {event}\n" if event else "") + f"data: {json.dumps(data)}\n\n"
+
+async def load_image(request, image, image_url):
+    """Read the upload or fetch the URL, then preprocess the image.
+    
+    Returns (img, image_bytes, image_stats, error_detail) as used by both
+    /analyze endpoints; failures are raised as HTTPException.
+    """
+    # Validate input - either image file or URL must be provided
+    if not image and not image_url:
+        raise HTTPException(status_code=400, detail="Either image file or image URL must be provided")
+    
+    # Process image from file upload; it has been spooled to a temporary file while the form was parsed
+    if image:
+        source = image.file
+        error_detail = "Error processing image"
+    
+    # Process image from URL
+    else:
+        error_detail = "Error fetching or processing image from URL"
+        try:
+            # For image URLs, we need to download the image first
+            with tracing.span("image.fetch"):
+                source = BytesIO(await request.app.state.fetcher.fetch(image_url))
+        except FetchError as e:
+            raise HTTPException(status_code=e.status_code, detail=f"{error_detail}: {str(e)}")
+    
+    try:
+        # For Gemini, we need to provide the image data directly
+        img, image_bytes, image_stats = await run_in_threadpool(prepare_image, source)
+    except images.ImageTooLarge as e:
+        raise HTTPException(status_code=413, detail=f"{error_detail}: {str(e)}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"{error_detail}: {str(e)}")
+    return img, image_bytes, image_stats, error_detail
 
 @app.get("/")
 def read_root():
     return {"message": "Multimodal QA API is running"}
 
+@app.get("/metrics")
+def metrics():
+    tracing.gauge("answer_cache_entries", answer_cache.stats()["memory_entries"])
+    tracing.gauge("answer_cache_in_flight", len(answer_flights))
+    fetcher = getattr(app.state, "fetcher", None)
+    if fetcher is not None:
+        for outcome, value in fetcher.stats().items():
+            tracing.gauge("image_fetches", value, outcome=outcome)
+    return PlainTextResponse(tracing.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+async def ask_model(model, img, question, error_detail):
+    """Ask Gemini about the image, falling back to a text-only prompt if its answer cannot be read."""
+    try:
+        # Create a content list for the API
+        response = await generate(model, [question, img])
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"{error_detail}: {str(e)}")
+    
+    # Extract the response
+    try:
+        return {
+            "answer": response.text,
+            "model_used": MODEL_NAME
+        }
+        
+    except Exception as e:
+        # Fallback to text-only prompt if vision analysis fails
+        try:
+            fallback_response = await generate(model, fallback_prompt(question), f"{MODEL_NAME} (fallback)")
+            
+            return {
+                "answer": fallback_response.text,
+                "model_used": f"{MODEL_NAME} (fallback)",
+                "error": str(e)
+            }
+        except Exception as fallback_error:
+            raise HTTPException(status_code=500, detail=f"Both primary and fallback models failed: {str(fallback_error)}")
+
+async def cached_answer(key):
+    # With ANSWER_CACHE_PATH set, a lookup may query SQLite, so it runs in a worker thread
+    if answer_cache.path:
+        return await run_in_threadpool(answer_cache.get, key)
+    return answer_cache.get(key)
+
+async def cache_answer(key, result):
+    if answer_cache.path:
+        await run_in_threadpool(answer_cache.set, key, json.dumps(result))
+    else:
+        answer_cache.set(key, json.dumps(result))
+
+async def ask_and_cache(model, img, question, error_detail, key):
+    result = await ask_model(model, img, question, error_detail)
+    # Fallback answers are not about the image, so they are not kept
+    if "error" not in result:
+        await cache_answer(key, result)
+    return result
+
+async def answer_question(model, img, image_bytes, question, error_detail):
+    """Answer from the cache, an identical request in flight, or a new Gemini call.
+    
+    Returns (result, status) where status is HIT, SHARED or MISS.
+    """
+    key = answer_key(answer_cache, MODEL_NAME, image_bytes, question)
+    cached = await cached_answer(key)
+    if cached is not None:
+        result, status = json.loads(cached), "HIT"
+    else:
+        result, shared = await answer_flights.run(
+            key, lambda: ask_and_cache(model, img, question, error_detail, key)
+        )
+        result, status = dict(result), "SHARED" if shared else "MISS"
+    tracing.count("answer_cache", result=status.lower())
+    return result, status
+
 @app.post("/analyze")
 async def analyze_image(
+    request: Request,
+    response: Response,
     image: Optional[UploadFile] = File(None),
     image_url: Optional[str] = Form(None),
     question: str = Form(...)
 ):
     try:
-        # Validate input - either image file or URL must be provided
-        if not image and not image_url:
-            raise HTTPException(status_code=400, detail="Either image file or image URL must be provided")
+        model = request.app.state.model
+        img, image_bytes, image_stats, error_detail = await load_image(request, image, image_url)
+        result, status = await answer_question(model, img, image_bytes, question, error_detail)
+        response.headers["X-Cache"] = status
         
-        # Get the multimodal model - using Gemini 1.5 Flash instead of the deprecated Pro Vision
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        # Process image from file upload
-        if image:
-            contents = await image.read()
+        if image_stats:
+            result["image"] = image_stats
+        return result
             
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analyze/batch")
+async def analyze_batch(
+    request: Request,
+    images: Optional[List[UploadFile]] = File(None),
+    image_urls: Optional[List[str]] = Form(None),
+    questions: List[str] = Form(...)
+):
+    """Ask every question about every image.
+    
+    Images are the uploads followed by the URLs, each fetched, decoded and
+    preprocessed once. At most BATCH_CONCURRENCY model calls run at a time.
+    Results come back image by image, in the order the questions were given,
+    each with "status": "ok" and the fields /analyze returns, or
+    "status": "error" and a "detail".
+    """
+    sources = [(upload, None) for upload in images or []] + [(None, url) for url in image_urls or []]
+    if not sources:
+        raise HTTPException(status_code=400, detail="At least one image file or image URL must be provided")
+    if len(sources) * len(questions) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"A batch can have at most {BATCH_MAX_ITEMS} image-question pairs")
+    
+    model = request.app.state.model
+    limit = asyncio.Semaphore(BATCH_CONCURRENCY)
+    
+    async def load(upload, url):
+        async with limit:
             try:
-                # For Gemini, we need to provide the image data directly
-                img = Image.open(BytesIO(contents))
-                
-                # Create a content list for the API
-                response = model.generate_content([
-                    question,
-                    img
-                ])
-                
-            except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error processing image: {str(e)}")
-        
-        # Process image from URL
-        else:
+                return await load_image(request, upload, url)
+            except HTTPException as e:
+                return e
+    
+    async def ask(loaded, question):
+        if isinstance(loaded, HTTPException):
+            return {"status": "error", "detail": loaded.detail}
+        img, image_bytes, _, error_detail = loaded
+        async with limit:
             try:
-                # For image URLs, we need to download the image first
-                response = requests.get(image_url)
-                img = Image.open(BytesIO(response.content))
-                
-                # Generate content with Gemini
-                response = model.generate_content([
-                    question,
-                    img
-                ])
-                
+                result, status = await answer_question(model, img, image_bytes, question, error_detail)
+            except HTTPException as e:
+                return {"status": "error", "detail": e.detail}
             except Exception as e:
-                raise HTTPException(status_code=500, detail=f"Error fetching or processing image from URL: {str(e)}")
-        
-        # Extract the response
+                return {"status": "error", "detail": str(e)}
+        return {"status": "ok", **result, "cache": status}
+    
+    loaded = await asyncio.gather(*(load(upload, url) for upload, url in sources))
+    answers = await asyncio.gather(*(ask(image, question) for image in loaded for question in questions))
+    
+    pairs = [(index, question) for index in range(len(sources)) for question in questions]
+    results = [{"image": index, "question": question, **answer} for (index, question), answer in zip(pairs, answers)]
+    
+    summary = []
+    for index, ((upload, url), image) in enumerate(zip(sources, loaded)):
+        entry = {"index": index, "source": upload.filename if upload else url}
+        if isinstance(image, HTTPException):
+            entry["error"] = image.detail
+        elif image[2]:
+            entry.update(image[2])
+        summary.append(entry)
+    return {"images": summary, "results": results}
+
+async def stream_answer(model, img, question, key, image_stats, cached):
+    if cached is not None:
+        result = json.loads(cached)
+        yield sse({"text": result["answer"]})
+    else:
+        parts = []
         try:
-            answer = response.text
-            
-            return {
-                "answer": answer,
-                "model_used": "gemini-1.5-flash"
-            }
-            
+            async for text in generate_stream(model, [question, img]):
+                parts.append(text)
+                yield sse({"text": text})
+            result = {"answer": "".join(parts), "model_used": MODEL_NAME}
+            await cache_answer(key, result)
         except Exception as e:
-            # Fallback to text-only model if vision analysis fails
+            if parts:
+                yield sse({"detail": f"Answer stream interrupted: {str(e)}"}, "error")
+                return
+            # Fallback to text-only prompt if vision analysis fails
             try:
-                # Use Gemini 1.5 Flash for text-only fallback
-                text_model = genai.GenerativeModel('gemini-1.5-flash')
-                fallback_prompt = f"I wanted to ask this question about an image: {question}\nHowever, the image analysis failed. Can you help me with what might be a general answer or what information you would need?"
-                
-                fallback_response = text_model.generate_content(fallback_prompt)
-                
-                return {
-                    "answer": fallback_response.text,
-                    "model_used": "gemini-1.5-flash (fallback)",
-                    "error": str(e)
-                }
+                async for text in generate_stream(model, fallback_prompt(question), f"{MODEL_NAME} (fallback)"):
+                    parts.append(text)
+                    yield sse({"text": text})
+                result = {"answer": "".join(parts), "model_used": f"{MODEL_NAME} (fallback)", "error": str(e)}
             except Exception as fallback_error:
-                raise HTTPException(status_code=500, detail=f"Both primary and fallback models failed: {str(fallback_error)}")
-            
+                yield sse({"detail": f"Both primary and fallback models failed: {str(fallback_error)}"}, "error")
+                return
+    
+    if image_stats:
+        result["image"] = image_stats
+    yield sse(result, "done")
+
+@app.post("/analyze/stream")
+async def analyze_image_stream(
+    request: Request,
+    image: Optional[UploadFile] = File(None),
+    image_url: Optional[str] = Form(None),
+    question: str = Form(...)
+):
+    """Like /analyze, but streams the answer as Server-Sent Events while Gemini generates it.
+    
+    Each chunk of text is a message event with {"text": ...}. A final "done"
+    event carries the JSON /analyze would return, and an "error" event with
+    {"detail": ...} reports a failure once the stream has started. Failures
+    before that are returned as normal HTTP errors.
+    """
+    try:
+        model = request.app.state.model
+        img, image_bytes, image_stats, _ = await load_image(request, image, image_url)
+        key = answer_key(answer_cache, MODEL_NAME, image_bytes, question)
+        cached = await cached_answer(key)
     except HTTPException as he:
         raise he
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    
+    status = "HIT" if cached is not None else "MISS"
+    tracing.count("answer_cache", result=status.lower())
+    return StreamingResponse(
+        stream_answer(model, img, question, key, image_stats, cached),
+        media_type="text/event-stream",
+        headers={"X-Cache": status, "Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,5 +1,20 @@
-import React, { useState } from 'react';
-import axios from 'axios';
+import React, { useRef, useState } from 'react';
+
+const API_URL = 'http://localhost:8000';
+
+// Parse one Server-Sent Event ("event: ...\ndata: ...") into { event, data }
+function parseEvent(block) {
+  let event = 'message';
+  const data = [];
+  for (const line of block.split('\n')) {
+    if (line.startsWith('event:')) {
+      event = line.slice(6).trim();
+    } else if (line.startsWith('data:')) {
+      data.push(line.slice(5).trim());
+    }
+  }
+  return data.length ? { event, data: JSON.parse(data.join('\n')) } : null;
+}
 
 function App() {
   const [imageFile, setImageFile] = useState(null);
@@ -10,6 +25,8 @@ function App() {
   const [error, setError] = useState('');
   const [previewUrl, setPreviewUrl] = useState('');
   const [inputMethod, setInputMethod] = useState('file'); // 'file' or 'url'
+  const [streaming, setStreaming] = useState(false);
+  const abortControllerRef = useRef(null);
 
   const handleImageChange = (e) => {
     const file = e.target.files[0];
@@ -53,6 +70,9 @@ function App() {
     setError('');
     setResponse(null);
     
+    const controller = new AbortController();
+    abortControllerRef.current = controller;
+    
     try {
       const formData = new FormData();
       
@@ -64,18 +84,61 @@ function App() {
       
       formData.append('question', question);
       
-      const response = await axios.post('http://localhost:8000/analyze', formData, {
-        headers: {
-          'Content-Type': 'multipart/form-data',
-        },
+      // The answer arrives as Server-Sent Events and is shown as it is generated
+      const res = await fetch(`${API_URL}/analyze/stream`, {
+        method: 'POST',
+        body: formData,
+        signal: controller.signal,
       });
       
-      setResponse(response.data);
+      if (!res.ok) {
+        const body = await res.json().catch(() => ({}));
+        throw new Error(body.detail || 'An error occurred while processing your request');
+      }
+      
+      setLoading(false);
+      setStreaming(true);
+      setResponse({ answer: '' });
+      
+      const reader = res.body.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        
+        // Events are separated by a blank line; keep any incomplete one for the next read
+        const blocks = buffer.split('\n\n');
+        buffer = blocks.pop();
+        for (const block of blocks) {
+          const message = parseEvent(block);
+          if (!message) continue;
+          if (message.event === 'message') {
+            setResponse((current) => ({ ...current, answer: current.answer + message.data.text }));
+          } else if (message.event === 'done') {
+            setResponse(message.data);
+          } else if (message.event === 'error') {
+            setError(message.data.detail);
+          }
+        }
+      }
     } catch (err) {
-      console.error('Error:', err);
-      setError(err.response?.data?.detail || 'An error occurred while processing your request');
+      if (err.name !== 'AbortError') {
+        console.error('Error:', err);
+        setError(err.message || 'An error occurred while processing your request');
+      }
     } finally {
+      abortControllerRef.current = null;
       setLoading(false);
+      setStreaming(false);
+    }
+  };
+
+  const handleCancel = () => {
+    if (abortControllerRef.current) {
+      abortControllerRef.current.abort();
     }
   };
 
@@ -143,9 +206,14 @@ function App() {
           />
         </div>
         
-        <button type="submit" disabled={loading}>
-          {loading ? 'Analyzing...' : 'Analyze Image'}
+        <button type="submit" disabled={loading || streaming}>
+          {loading ? 'Analyzing...' : streaming ? 'Answering...' : 'Analyze Image'}
         </button>
+        {(loading || streaming) && (
+          <button type="button" onClick={handleCancel} style={{ marginLeft: '1rem' }}>
+            Cancel
+          </button>
+        )}
       </form>
       
       {error && <div className="error">{error}</div>}
@@ -155,8 +223,8 @@ function App() {
       {response && (
         <div className="response-container">
           <h3>Response:</h3>
-          <p>{response.answer}</p>
-          <p><em>Model used: {response.model_used}</em></p>
+          <p style={{ whiteSpace: 'pre-wrap' }}>{response.answer}</p>
+          {response.model_used && <p><em>Model used: {response.model_used}</em></p>}
           {response.error && <p className="error">Error: {response.error}</p>}
         </div>
       )}
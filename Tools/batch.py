@@ -0,0 +1,167 @@
+"""Run many queries concurrently and stream the results as JSONL.
+
+Usage:
+    python batch.py queries.jsonl > results.jsonl
+    cat queries.jsonl | python batch.py - --concurrency 16 -o results.jsonl
+
+Each input line is either a JSON object with a "query" field (and an
+optional "id") or a JSON string. Results are written one JSON object per
+line in the order the queries finish, tagged with the input line index.
+A line that is not valid JSON or has no "query" is reported as an
+{"index", "error"} result and the rest of the batch goes on.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+
+from openai import AsyncOpenAI, RateLimitError
+
+from main import llm_cache_key, message_to_dict, planner, query_steps, response_cache, tracing
+
+
+async def aget_llm_message(client, request, model, max_retries, base_delay):
+    """Async counterpart of get_llm_message, retrying rate-limited requests with backoff."""
+    cache_key = llm_cache_key(request, model)
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        tracing.count("llm_cache_hits")
+        return json.loads(cached)
+
+    for attempt in range(max_retries + 1):
+        try:
+            with tracing.span("llm.request", labels={"model": model}, attempt=attempt) as span:
+                response = await client.chat.completions.create(
+                    model=model,
+                    temperature=0,
+                    **request
+                )
+                if response.usage:
+                    span.set(prompt_tokens=response.usage.prompt_tokens, completion_tokens=response.usage.completion_tokens)
+            break
+        except RateLimitError as e:
+            if attempt == max_retries:
+                print(f"Rate limited after {max_retries} retries: {str(e)}", file=sys.stderr)
+                return None
+            # Honour the server's Retry-After when present, otherwise back off exponentially with jitter
+            retry_after = e.response.headers.get("retry-after") if e.response is not None else None
+            try:
+                delay = float(retry_after)
+            except (TypeError, ValueError):
+                delay = base_delay * (2 ** attempt) * (1 + random.random())
+            await asyncio.sleep(delay)
+        except Exception as e:
+            print(f"Error calling OpenAI API: {str(e)}", file=sys.stderr)
+            return None
+
+    message = message_to_dict(response.choices[0].message)
+    response_cache.set(cache_key, json.dumps(message))
+    return message
+
+
+async def aprocess_query(client, query, model, max_retries, base_delay):
+    """Drive query_steps with the async client; the counterpart of process_query."""
+    steps = query_steps(query)
+    try:
+        request = next(steps)
+        while True:
+            message = await aget_llm_message(client, request, model, max_retries, base_delay)
+            request = steps.send(message)
+    except StopIteration as done:
+        return done.value
+
+
+def read_queries(stream):
+    """Yield (index, line) for each non-blank input line; parse_query turns a line into (id, query)."""
+    for index, line in enumerate(stream):
+        line = line.strip()
+        if line:
+            yield index, line
+
+
+def parse_query(line):
+    """Return (id, query) for one input line, raising ValueError if it is not a query."""
+    item = json.loads(line)
+    if isinstance(item, str):
+        return None, item
+    if not isinstance(item, dict) or not isinstance(item.get("query"), str):
+        raise ValueError('expected a JSON string or an object with a "query" string')
+    return item.get("id"), item["query"]
+
+
+async def run_batch(queries, output, client, model="gpt-3.5-turbo", concurrency=8, max_retries=5, base_delay=1.0):
+    """Process queries with at most `concurrency` in flight, writing each result as soon as it is ready."""
+    pending = asyncio.Queue(maxsize=concurrency * 2)
+    counts = {"ok": 0, "error": 0}
+
+    async def worker():
+        while True:
+            item = await pending.get()
+            if item is None:
+                return
+            index, line = item
+            try:
+                query_id, query = parse_query(line)
+            except ValueError as e:
+                # One bad line is reported on its own and does not stop the batch
+                counts["error"] += 1
+                output.write(json.dumps({"index": index, "error": f"Invalid input line: {e}"}) + "\n")
+                output.flush()
+                continue
+            try:
+                result = await aprocess_query(client, query, model, max_retries, base_delay)
+            except Exception as e:
+                result = {"query": query, "error": str(e)}
+            counts["error" if "error" in result else "ok"] += 1
+            output.write(json.dumps({"index": index, "id": query_id, **result}, default=str) + "\n")
+            output.flush()
+
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    for item in queries:
+        await pending.put(item)
+    for _ in workers:
+        await pending.put(None)
+    await asyncio.gather(*workers)
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queries from a JSONL file concurrently.")
+    parser.add_argument("input", help="JSONL file of queries, or - for stdin")
+    parser.add_argument("-o", "--output", help="Write results here instead of stdout")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("BATCH_CONCURRENCY", 8)))
+    parser.add_argument("--max-retries", type=int, default=5, help="Retries per request on rate-limit errors")
+    parser.add_argument("--base-delay", type=float, default=1.0, help="First backoff delay in seconds")
+    parser.add_argument("--model", default="gpt-3.5-turbo")
+    parser.add_argument("--base-url", default=os.getenv("OPENAI_BASE_URL"), help="OpenAI-compatible API endpoint")
+    args = parser.parse_args()
+
+    # Retries are handled by aget_llm_message so --max-retries is the only retry budget
+    client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), base_url=args.base_url, max_retries=0)
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        counts = asyncio.run(run_batch(
+            read_queries(source), output, client, args.model,
+            args.concurrency, args.max_retries, args.base_delay,
+        ))
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if output is not sys.stdout:
+            output.close()
+
+    cache_stats = response_cache.stats()
+    planner_stats = planner.stats()
+    print(
+        f"Processed {counts['ok'] + counts['error']} queries ({counts['error']} errors); "
+        f"answered locally: {planner_stats['planned']} ({planner_stats['coverage']:.0%}); "
+        f"LLM cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses",
+        file=sys.stderr,
+    )
+
+
+if __name__ == "__main__":
+    main()
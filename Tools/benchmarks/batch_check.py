@@ -0,0 +1,134 @@
+"""Check batch.py against a local chat completions server that rate-limits every query once.
+
+Usage: python benchmarks/batch_check.py [--queries 12] [--concurrency 4]
+
+The server answers POST /v1/chat/completions. The first request for each
+query gets a 429, half of them with a Retry-After header and half without,
+and the retry is answered after a delay that differs per query. batch.py
+runs in a subprocess with --base-url pointing at the server, on the queries
+plus a line that is not JSON and one without a "query". The check fails
+if a query is not retried, if the server ever sees more requests at once
+than --concurrency, if Retry-After is not honoured, or if the results are
+not one JSONL line per input line in the order the server finished them.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+BATCH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "batch.py")
+RETRY_AFTER = 0.2
+BASE_DELAY = 0.01
+
+
+class Handler(BaseHTTPRequestHandler):
+    requests = Counter()
+    last_429 = {}
+    waited = {}
+    finished = []
+    in_flight = 0
+    max_in_flight = 0
+    lock = threading.Lock()
+
+    def do_POST(self):
+        if self.path != "/v1/chat/completions":
+            return self.reply(404, {}, {"error": {"message": "not found"}})
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        query = body["messages"][-1]["content"]
+        number = int(query.rsplit(" ", 1)[1])
+        with Handler.lock:
+            Handler.in_flight += 1
+            Handler.max_in_flight = max(Handler.max_in_flight, Handler.in_flight)
+            Handler.requests[query] += 1
+            attempt = Handler.requests[query]
+        try:
+            if attempt == 1:
+                Handler.last_429[query] = time.perf_counter()
+                headers = {"Retry-After": str(RETRY_AFTER)} if number % 2 == 0 else {}
+                return self.reply(429, headers, {"error": {"message": "rate limited", "type": "rate_limit"}})
+            Handler.waited[query] = time.perf_counter() - Handler.last_429[query]
+            # Later queries finish first, so the completion order is not the input order
+            time.sleep(0.02 * (20 - number % 20))
+            with Handler.lock:
+                Handler.finished.append(number)
+            self.reply(200, {}, {
+                "id": f"chatcmpl-{number}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": f"answer {number}"},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+            })
+        finally:
+            with Handler.lock:
+                Handler.in_flight -= 1
+
+    def reply(self, status, headers, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=12)
+    parser.add_argument("--concurrency", type=int, default=4)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    lines = [json.dumps({"id": f"q{n}", "query": f"Write a short poem about query {n}"}) for n in range(args.queries)]
+    lines[2:2] = ["{not json", json.dumps({"id": "empty"})]
+    env = dict(os.environ, LLM_CACHE="off", OPENAI_API_KEY="stub")
+    start = time.perf_counter()
+    done = subprocess.run(
+        [sys.executable, BATCH, "-", "--base-url", f"http://127.0.0.1:{server.server_address[1]}/v1",
+         "--concurrency", str(args.concurrency), "--base-delay", str(BASE_DELAY), "--max-retries", "2"],
+        input="\n".join(lines) + "\n", capture_output=True, text=True, env=env, check=True,
+    )
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    results = [json.loads(line) for line in done.stdout.splitlines()]
+
+    print(f"{len(lines)} input lines, {len(results)} results in {elapsed:.2f}s")
+    print(f"server: {sum(Handler.requests.values())} requests for {len(Handler.requests)} queries, "
+          f"at most {Handler.max_in_flight} at once (limit {args.concurrency})")
+    print(done.stderr.strip())
+
+    assert sorted(result["index"] for result in results) == list(range(len(lines))), "not one result per input line"
+    errors = {result["index"]: result["error"] for result in results if "error" in result}
+    assert sorted(errors) == [2, 3], f"only the two bad lines should fail: {errors}"
+    assert all(count == 2 for count in Handler.requests.values()), "every query should be retried once after its 429"
+    for query, waited in Handler.waited.items():
+        number = int(query.rsplit(" ", 1)[1])
+        assert waited >= (RETRY_AFTER if number % 2 == 0 else BASE_DELAY), f"{query!r} retried after {waited:.3f}s"
+    assert Handler.max_in_flight <= args.concurrency, "more requests in flight than --concurrency"
+    answered = [int(result["id"][1:]) for result in results if "error" not in result]
+    assert answered == Handler.finished, f"results {answered} not in completion order {Handler.finished}"
+    assert answered != sorted(answered), "the check expects queries to finish out of input order"
+    for result in results:
+        if "error" not in result:
+            assert result["answer"] == f"answer {result['id'][1:]}"
+    print(f"completion order: {answered}")
+
+
+if __name__ == "__main__":
+    main()
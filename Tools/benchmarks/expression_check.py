@@ -0,0 +1,107 @@
+"""Check that the arithmetic engine behind basic_calculator rejects everything but arithmetic.
+
+Usage: python benchmarks/expression_check.py [--rows 1000]
+
+Expressions that reach for attributes, builtins, lambdas, comprehensions or
+subscripts must raise ExpressionError before anything runs, and so must
+powers past the exponent and integer-size caps. A repeated expression must
+come from compile_expression's LRU cache. evaluate_batch must give the same
+result as evaluate for every row, including min and max with more than two
+arguments, and must leave the caller's columns unchanged.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools.expression import (
+    MAX_EXPONENT,
+    ExpressionError,
+    compile_expression,
+    evaluate,
+    evaluate_batch,
+)
+
+REJECTED = [
+    ("attribute", "(1).__class__"),
+    ("attribute on a function", "sqrt.__globals__"),
+    ("__import__", "__import__('os').system('echo hacked')"),
+    ("builtin", "open('/etc/passwd')"),
+    ("underscore name", "_pow(2, 3)"),
+    ("lambda", "(lambda: 1)()"),
+    ("list comprehension", "[x for x in (1, 2)]"),
+    ("generator", "sum(x for x in (1, 2))"),
+    ("subscript", "(1, 2)[0]"),
+    ("string constant", "'a' * 3"),
+    ("keyword argument", "round(2.5, ndigits=1)"),
+    ("bare function", "sqrt"),
+    ("comparison", "1 < 2"),
+    ("walrus", "(x := 1)"),
+    ("too long", "1+" * 600 + "1"),
+    ("exponent cap", f"2 ** {MAX_EXPONENT + 1}"),
+    ("negative exponent cap", f"2.0 ** -{MAX_EXPONENT + 1}"),
+    ("nested exponent cap", "2 ** (10 ** 4)"),
+    ("integer bit cap", f"(10 ** 100) ** {MAX_EXPONENT}"),
+]
+
+BATCH_EXPRESSIONS = [
+    "(x + 2) * y - z / 4",
+    "min(x, y, z)",
+    "max(x, y, z, 50)",
+    "min(x, 3)",
+    "sqrt(abs(x)) + floor(y) - ceil(z)",
+    "x ** 2 + y % 7 - z // 3",
+    "round(x / 3) + max(y, z)",
+    "exp(-abs(x) / 100) * sin(y) + cos(z) * pi",
+    "2 ** 10 + e",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000)
+    args = parser.parse_args()
+
+    for name, expression in REJECTED:
+        try:
+            evaluate(expression)
+        except ExpressionError as e:
+            print(f"{name:<24} rejected: {e}")
+        else:
+            raise AssertionError(f"{name}: {expression!r} was evaluated")
+    assert evaluate(f"2 ** {MAX_EXPONENT}") == 2 ** MAX_EXPONENT, "the exponent cap is off by one"
+
+    compile_expression.cache_clear()
+    for _ in range(3):
+        evaluate("(x + 2) * 3", {"x": 4})
+    info = compile_expression.cache_info()
+    print(f"compile cache: {info.hits} hits, {info.misses} misses")
+    assert info.misses == 1 and info.hits == 2, info
+
+    rng = random.Random(0)
+    columns = {name: [rng.uniform(-100, 100) for _ in range(args.rows)] for name in "xyz"}
+    originals = {name: np.array(values) for name, values in columns.items()}
+    arrays = {name: np.array(values) for name, values in columns.items()}
+    for expression in BATCH_EXPRESSIONS:
+        batch = evaluate_batch(expression, arrays)
+        rows = [evaluate(expression, {name: values[i] for name, values in columns.items()}) for i in range(args.rows)]
+        assert len(batch) == args.rows
+        for i, (vector, scalar) in enumerate(zip(batch, rows)):
+            assert math.isclose(vector, scalar, rel_tol=1e-9, abs_tol=1e-9), (expression, i, vector, scalar)
+        print(f"{expression:<44} {args.rows} rows match evaluate()")
+    for name, array in arrays.items():
+        assert np.array_equal(array, originals[name]), f"evaluate_batch modified column {name}"
+
+    rows = [{"x": 5, "y": 1, "z": 7}, {"x": 6, "y": 9, "z": 0}]
+    assert evaluate_batch("min(x, y, z)", rows).tolist() == [1.0, 0.0]
+    assert evaluate_batch("max(x, y, 8)", rows).tolist() == [8.0, 9.0]
+    print("evaluate_batch with row dicts and a constant min/max argument: ok")
+
+
+if __name__ == "__main__":
+    main()
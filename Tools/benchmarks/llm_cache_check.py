@@ -0,0 +1,125 @@
+"""Check the LLM response cache with a stub client that counts the API calls.
+
+Usage: python benchmarks/llm_cache_check.py
+
+main.client is replaced by a stub whose chat.completions.create counts its
+calls and answers without tool calls, and the cache is kept in a temporary
+SQLite file. Each check prints the calls the stub saw and fails if:
+
+- a repeated process_query reaches the client
+- a new ResponseCache on the same file misses the disk tier
+- entries outlive the TTL or the memory and disk tiers exceed their caps
+- an entry kept hot by memory hits is evicted from disk before colder ones
+- LLM_CACHE=off or use_cache=False does not reach the client every time
+- LLM_CACHE=off still creates the SQLite file
+"""
+import importlib
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+QUERY = "Write a short poem about caching"
+
+
+class StubCompletions:
+    calls = 0
+
+    def create(self, model, messages, **params):
+        StubCompletions.calls += 1
+        message = SimpleNamespace(content=f"poem {StubCompletions.calls}", tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def stub_client():
+    return SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions()))
+
+
+def check(name, run, expected_calls):
+    before = StubCompletions.calls
+    run()
+    calls = StubCompletions.calls - before
+    print(f"{name:<44} {calls:>5} {expected_calls:>8}")
+    assert calls == expected_calls, f"{name}: {calls} calls to the client, expected {expected_calls}"
+
+
+def disk_keys(path):
+    with sqlite3.connect(path) as db:
+        return {key for (key,) in db.execute("SELECT key FROM responses")}
+
+
+def main():
+    path = os.path.join(tempfile.mkdtemp(), "llm_cache.sqlite")
+    os.environ.update(LLM_CACHE_PATH=path, LLM_CACHE="on", OPENAI_API_KEY="stub")
+    import main as tools_main
+    from shared.llm_cache import ResponseCache
+
+    tools_main.client = stub_client()
+    assert tools_main.planner.plan(QUERY) is None, "the query must go to the LLM"
+    print(f"{'check':<44} {'calls':>5} {'expected':>8}")
+
+    results = []
+    check("first process_query", lambda: results.append(tools_main.process_query(QUERY)), 1)
+    check("repeated process_query", lambda: results.append(tools_main.process_query(QUERY)), 0)
+    assert results[0] == results[1], "the cached result differs"
+
+    tools_main.response_cache = ResponseCache(path=path)
+    check("process_query with a new cache on the file", lambda: tools_main.process_query(QUERY), 0)
+    assert tools_main.response_cache.stats()["disk_hits"] == 1, "the new cache did not hit the disk tier"
+
+    request = {"messages": [{"role": "user", "content": QUERY}]}
+    check("get_llm_message with use_cache=False", lambda: [
+        tools_main.get_llm_message(request, use_cache=False) for _ in range(2)
+    ], 2)
+
+    off_path = os.path.join(os.path.dirname(path), "off.sqlite")
+    os.environ.update(LLM_CACHE="off", LLM_CACHE_PATH=off_path)
+    importlib.reload(tools_main)
+    tools_main.client = stub_client()
+    check("process_query twice with LLM_CACHE=off", lambda: [tools_main.process_query(QUERY) for _ in range(2)], 2)
+    assert not tools_main.response_cache.enabled
+    assert not os.path.exists(off_path), "a disabled cache created its SQLite file"
+
+    ttl_path = os.path.join(os.path.dirname(path), "ttl.sqlite")
+    cache = ResponseCache(path=ttl_path, ttl=0.2)
+    cache.set("key", "value")
+    assert cache.get("key") == "value"
+    time.sleep(0.3)
+    assert cache.get("key") is None, "the memory tier served an expired entry"
+    cache.set("key", "value")
+    time.sleep(0.3)
+    assert ResponseCache(path=ttl_path, ttl=0.2).get("key") is None, "the disk tier served an expired entry"
+    assert "key" not in disk_keys(ttl_path), "the expired entry was not deleted from disk"
+    print("entries expire after the TTL in both tiers")
+
+    caps_path = os.path.join(os.path.dirname(path), "caps.sqlite")
+    cache = ResponseCache(path=caps_path, max_memory_entries=2, max_disk_entries=3)
+    keys = [f"key{i}" for i in range(5)]
+    for key in keys:
+        cache.set(key, key)
+        time.sleep(0.01)
+    assert cache.stats()["memory_entries"] == 2
+    assert disk_keys(caps_path) == set(keys[2:]), "the disk tier did not evict the least recently used"
+    fresh = ResponseCache(path=caps_path)
+    assert [fresh.get(key) for key in keys] == [None, None] + keys[2:]
+    print("the memory tier keeps 2 entries and the disk tier 3, as configured")
+
+    hot_path = os.path.join(os.path.dirname(path), "hot.sqlite")
+    cache = ResponseCache(path=hot_path, max_memory_entries=2, max_disk_entries=3)
+    for key in keys:
+        cache.set(key, key)
+        time.sleep(0.01)
+        # Served from memory every time, so only its access time on disk can keep it
+        assert cache.get(keys[0]) == keys[0]
+        time.sleep(0.01)
+    assert cache.stats()["disk_hits"] == 0
+    assert disk_keys(hot_path) == {keys[0]} | set(keys[3:]), "the disk tier evicted the entry hit in memory"
+    print("an entry hit only in memory stays on disk while colder ones are evicted")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Compare the single-pass ToolCallParser with the original multi-regex parser.
+
+Usage: python benchmarks/parser_benchmark.py [--repeat N]
+
+The "nested" rows end in a call nested in another's arguments. It takes the
+parser a second pass over the text, and the check at the end makes sure the
+outer call refers to the inner one's result.
+"""
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tool_parser import ToolCallParser
+
+
+def legacy_parse_tool_call(reasoning):
+    """The original parse_tool_call from main.py, kept as the baseline."""
+    tool_patterns = {
+        "calculate_square_root": r"calculate_square_root\s*\(\s*([0-9.]+)\s*\)",
+        "calculate_average": r"calculate_average\s*\(\s*\[\s*([0-9.,\s]+)\s*\]\s*\)",
+        "is_greater_than": r"is_greater_than\s*\(\s*([0-9.]+)\s*,\s*([0-9.]+)\s*\)",
+        "basic_calculator": r"basic_calculator\s*\(\s*['\"]([^'\"]+)['\"]\s*\)",
+        "count_vowels": r"count_vowels\s*\(\s*['\"]([^'\"]+)['\"]\s*\)",
+        "count_letters": r"count_letters\s*\(\s*['\"]([^'\"]+)['\"]\s*\)",
+        "count_words": r"count_words\s*\(\s*['\"]([^'\"]+)['\"]\s*\)",
+        "contains_substring": r"contains_substring\s*\(\s*['\"]([^'\"]+)['\"],\s*['\"]([^'\"]+)['\"]\s*\)"
+    }
+
+    for tool_name, pattern in tool_patterns.items():
+        match = re.search(pattern, reasoning)
+        if match:
+            if tool_name == "calculate_average":
+                numbers = [float(num.strip()) for num in match.group(1).split(',')]
+                return {"tool": tool_name, "params": [numbers]}
+            elif tool_name == "is_greater_than":
+                return {"tool": tool_name, "params": [float(match.group(1)), float(match.group(2))]}
+            elif tool_name == "contains_substring":
+                return {"tool": tool_name, "params": [match.group(1), match.group(2)]}
+            elif tool_name in ["basic_calculator", "count_vowels", "count_letters", "count_words"]:
+                return {"tool": tool_name, "params": [match.group(1)]}
+            else:
+                return {"tool": tool_name, "params": [float(match.group(1))]}
+
+    if "vowels" in reasoning.lower() and "in" in reasoning.lower():
+        word_match = re.search(r"vowels\s+in\s+['\"]([^'\"]+)['\"]", reasoning, re.IGNORECASE)
+        if word_match:
+            return {"tool": "count_vowels", "params": [word_match.group(1)]}
+
+    if "letters" in reasoning.lower() and "in" in reasoning.lower():
+        word_match = re.search(r"letters\s+in\s+['\"]([^'\"]+)['\"]", reasoning, re.IGNORECASE)
+        if word_match:
+            return {"tool": "count_letters", "params": [word_match.group(1)]}
+
+    words_in_quotes = re.findall(r"['\"]([^'\"]+)['\"]", reasoning)
+    if words_in_quotes and ("extraordinary" in words_in_quotes):
+        return {"tool": "count_vowels", "params": ["extraordinary"]}
+
+    return None
+
+
+FILLER = (
+    "Reasoning: To answer this we first consider the structure of the problem. "
+    "Each step is checked carefully before moving on, and intermediate values are noted. "
+)
+CALLS = (
+    'Tool Call: count_letters("machine")\n',
+    'Tool Call: count_vowels("reasoning")\n',
+    "Tool Call: is_greater_than(7, 3)\n",
+    "Tool Call: calculate_average([18, 50, 12.5])\n",
+)
+NESTED = "Tool Call: calculate_square_root(calculate_average([18, 50]))\n"
+
+
+def make_response(filler_repeats, calls_every):
+    """Build a long reasoning transcript with tool calls sprinkled through it."""
+    parts = []
+    for i in range(filler_repeats):
+        parts.append(FILLER)
+        if calls_every and i % calls_every == 0:
+            parts.append(CALLS[(i // calls_every) % len(CALLS)])
+    return "".join(parts)
+
+
+def time_it(func, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func(text)
+    return (time.perf_counter() - start) / repeat
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument("--repeat", type=int, default=20)
+    args = arg_parser.parse_args()
+
+    parser = ToolCallParser()
+    # The legacy parser stops at the first call, the single-pass parser returns all of them
+    print(f"{'size':>10} {'calls':>6} {'legacy (ms)':>12} {'single-pass (ms)':>17} {'found':>6}")
+    for filler_repeats in (10, 100, 1000, 10000):
+        # The last call sits at the very end, the worst case for the legacy parser
+        text = make_response(filler_repeats, calls_every=0) + CALLS[3]
+        legacy = time_it(legacy_parse_tool_call, text, args.repeat)
+        single = time_it(parser.parse, text, args.repeat)
+        found = len(parser.parse(text))
+        print(f"{len(text):>10} {1:>6} {legacy * 1000:>12.3f} {single * 1000:>17.3f} {found:>6}")
+
+        text = make_response(filler_repeats, calls_every=5)
+        legacy = time_it(legacy_parse_tool_call, text, args.repeat)
+        single = time_it(parser.parse, text, args.repeat)
+        found = len(parser.parse(text))
+        print(f"{len(text):>10} {'many':>6} {legacy * 1000:>12.3f} {single * 1000:>17.3f} {found:>6}")
+
+        text = make_response(filler_repeats, calls_every=0) + NESTED
+        legacy = time_it(legacy_parse_tool_call, text, args.repeat)
+        single = time_it(parser.parse, text, args.repeat)
+        found = len(parser.parse(text))
+        print(f"{len(text):>10} {'nested':>6} {legacy * 1000:>12.3f} {single * 1000:>17.3f} {found:>6}")
+
+    calls = parser.parse(NESTED)
+    print(f"nested call parsed as {calls}")
+    assert calls == [
+        {"tool": "calculate_average", "params": [[18.0, 50.0]]},
+        {"tool": "calculate_square_root", "params": [{"ref": 0}]},
+    ], calls
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Check the local planner's answers to the README examples and the queries main.py used to hard-code.
+
+Usage: python benchmarks/planner_check.py
+
+Each known query must be planned, with the expected answer and tools, and
+without any LLM call. Queries in shapes the planner does not know must
+return None and be counted as fallbacks, so they still reach the LLM. The
+check prints each query with its answer and fails on any difference.
+"""
+import math
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from planner import LocalPlanner
+
+SQRT_OF_AVERAGE = math.sqrt((18 + 50) / 2)
+
+# (query, expected answer, tools called in order)
+PLANNED = [
+    # The README examples; all but the fourth were hard-coded shortcuts in main.py before the planner
+    ("What's the square root of the average of 18 and 50?",
+     f"The square root of the average of 18 and 50 is {SQRT_OF_AVERAGE}.",
+     ["calculate_average", "calculate_square_root"]),
+    ("How many vowels are in the word 'Multimodality'?",
+     "There are 5 vowels in 'Multimodality'.",
+     ["count_vowels"]),
+    ("Is the number of letters in 'machine' greater than the number of vowels in 'reasoning'?",
+     "Yes, the number of letters in 'machine' (7) is greater than the number of vowels in 'reasoning' (4).",
+     ["count_letters", "count_vowels", "is_greater_than"]),
+    ("What is 15% of the sum of 120 and 280?",
+     "15% of the sum of 120 and 280 is 60.",
+     ["basic_calculator", "basic_calculator"]),
+    ("Does 'extraordinary' have more consonants than vowels?",
+     "Yes, 'extraordinary' has more consonants (8) than vowels (5).",
+     ["count_letters", "count_vowels", "basic_calculator", "is_greater_than"]),
+    # Other shapes the planner covers
+    ("Count the words in \"the quick brown fox\"", "There are 4 words in 'the quick brown fox'.", ["count_words"]),
+    ("Does 'reasoning' contain 'son'?", "Yes, 'reasoning' contains 'son'.", ["contains_substring"]),
+    ("What is (3 + 4) * 2^3?", "(3 + 4) * 2^3 = 56", ["basic_calculator"]),
+    ("Is 7 less than 3?", "No, 7 is not less than 3.", ["is_greater_than"]),
+]
+
+FALLBACKS = [
+    "Write a poem about multimodality",
+    "What is love?",
+    "Is Paris bigger than London?",
+    "How many vowels are in multimodality?",
+    "What's the square root of a negative number?",
+    "Summarise the history of machine reasoning",
+]
+
+
+def main():
+    planner = LocalPlanner()
+
+    for query, answer, tools in PLANNED:
+        result = planner.plan(query)
+        assert result is not None, f"{query!r} was not planned"
+        print(f"{query:<90} -> {result['answer']}")
+        assert result["answer"] == answer, (query, result["answer"])
+        assert result["tool_used"] == ", ".join(tools), (query, result["tool_used"])
+        assert result["query"] == query and result["reasoning"].count("\n") == len(tools) - 1
+
+    for query in FALLBACKS:
+        assert planner.plan(query) is None, f"{query!r} should fall back to the LLM"
+        print(f"{query:<90} -> None (LLM)")
+
+    stats = planner.stats()
+    print(f"planned {stats['planned']}, fallbacks {stats['fallbacks']}, coverage {stats['coverage']:.0%}")
+    assert stats["planned"] == len(PLANNED) and stats["fallbacks"] == len(FALLBACKS)
+
+
+if __name__ == "__main__":
+    main()
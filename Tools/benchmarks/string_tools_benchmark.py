@@ -0,0 +1,100 @@
+"""Compare the bulk, streaming string tools with reading a file and calling the per-string tools.
+
+Usage: python benchmarks/string_tools_benchmark.py [--sizes 1MB,100MB,1GB] [--baseline-limit 100MB]
+
+The baseline loads the whole file into one str, so it is skipped for files
+larger than --baseline-limit to avoid exhausting memory.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tools import string_tools
+
+UNITS = {"KB": 1024, "MB": 1024 ** 2, "GB": 1024 ** 3}
+SAMPLE = (
+    "Multimodal models combine text and images. The quick brown fox jumps over the lazy dog.\n"
+    "Reasoning systems call tools to count vowels, letters and words in whole documents.\t"
+)
+
+
+def parse_size(text):
+    text = text.strip().upper()
+    for unit, factor in UNITS.items():
+        if text.endswith(unit):
+            return int(float(text[:-len(unit)]) * factor)
+    return int(text)
+
+
+def write_sample(path, size):
+    block = (SAMPLE * (1024 * 1024 // len(SAMPLE) + 1)).encode("utf-8")
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            f.write(block[:remaining])
+            remaining -= len(block)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def baseline(path):
+    text = Path(path).read_text(encoding="utf-8")
+    return (
+        string_tools.count_vowels(text),
+        string_tools.count_letters(text),
+        string_tools.count_words(text),
+        string_tools.contains_substring(text, "LAZY DOG"),
+    )
+
+
+def bulk(path):
+    items = [Path(path)]
+    return (
+        string_tools.count_vowels_bulk(items)[0],
+        string_tools.count_letters_bulk(items)[0],
+        string_tools.count_words_bulk(items)[0],
+        string_tools.contains_substring_bulk(items, "LAZY DOG")[0],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1MB,100MB,1GB")
+    parser.add_argument("--baseline-limit", default="100MB")
+    args = parser.parse_args()
+    baseline_limit = parse_size(args.baseline_limit)
+
+    # Peak heap allocated by the bulk tools; mapped file pages are page cache, not heap
+    print(f"{'size':>8} {'baseline (s)':>13} {'bulk (s)':>9} {'speedup':>8} {'bulk peak (MB)':>15}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for label in args.sizes.split(","):
+            size = parse_size(label)
+            path = os.path.join(tmp, f"sample_{size}.txt")
+            write_sample(path, size)
+
+            tracemalloc.start()
+            bulk_result, bulk_time = timed(lambda: bulk(path))
+            peak = tracemalloc.get_traced_memory()[1] / (1024 * 1024)
+            tracemalloc.stop()
+            if size <= baseline_limit:
+                base_result, base_time = timed(lambda: baseline(path))
+                assert base_result == bulk_result, (base_result, bulk_result)
+                base_text, speedup = f"{base_time:.3f}", f"{base_time / bulk_time:.1f}x"
+            else:
+                base_text, speedup = "skipped", "-"
+            print(f"{label.strip():>8} {base_text:>13} {bulk_time:>9.3f} {speedup:>8} {peak:>15.1f}")
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,248 +1,229 @@
 import os
-import re
+import sys
 import json
 from dotenv import load_dotenv
 from openai import OpenAI
-from tools import math_tools, string_tools
+from tools.registry import TOOLS, OPENAI_TOOLS, arguments_to_params, call_tool
+from concurrent.futures import ThreadPoolExecutor
+from tool_parser import ToolCallParser
+from tool_plan import execute_plan, format_call
+from planner import LocalPlanner
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from shared import tracing
+from shared.llm_cache import ResponseCache
 
 load_dotenv()
 
 client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+tool_parser = ToolCallParser()
+planner = LocalPlanner()
+tool_executor = ThreadPoolExecutor(max_workers=int(os.getenv("TOOL_WORKERS", 4)))
+
+MAX_TOOL_ROUNDS = 5
+
+SYSTEM_PROMPT = """You answer queries with the help of the provided tools.
+You MUST use the tools for every calculation or string operation, even simple ones. Never calculate yourself.
+Request tool calls that do not depend on each other together, in the same turn; they run in parallel.
+When the result of a call is itself the complete answer to the query (for example a count or a yes/no comparison), set its "final" argument to true.
+Once you have all the results you need, reply with the final answer only."""
+
+# Responses are deterministic (temperature=0), so identical requests are served from the cache
+response_cache = ResponseCache(
+    path=os.getenv("LLM_CACHE_PATH", ".llm_cache.sqlite") or None,
+    max_memory_entries=int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", 256)),
+    max_disk_entries=int(os.getenv("LLM_CACHE_DISK_ENTRIES", 10000)),
+    ttl=float(os.getenv("LLM_CACHE_TTL", 7 * 24 * 3600)),
+    enabled=os.getenv("LLM_CACHE", "on").lower() not in ("0", "off", "false"),
+)
 
-def get_llm_response(prompt, model="gpt-3.5-turbo"):
+def llm_cache_key(request, model):
+    return response_cache.make_key(model, request["messages"], tools=request.get("tools"), temperature=0)
+
+def message_to_dict(message):
+    """Convert an API message to the plain dict that is cached and appended to the conversation."""
+    result = {"role": "assistant", "content": message.content}
+    if message.tool_calls:
+        result["tool_calls"] = [
+            {
+                "id": call.id,
+                "type": "function",
+                "function": {"name": call.function.name, "arguments": call.function.arguments},
+            }
+            for call in message.tool_calls
+        ]
+    return result
+
+def get_llm_message(request, model="gpt-3.5-turbo", use_cache=True):
+    """Send a {"messages": ..., "tools": ...} request and return the assistant message as a dict."""
+    cache_key = llm_cache_key(request, model)
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            tracing.count("llm_cache_hits")
+            return json.loads(cached)
+    
     try:
-        response = client.chat.completions.create(
-            model=model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0
-        )
-        return response.choices[0].message.content.strip()
+        with tracing.span("llm.request", labels={"model": model}) as span:
+            response = client.chat.completions.create(
+                model=model,
+                temperature=0,
+                **request
+            )
+            if response.usage:
+                span.set(prompt_tokens=response.usage.prompt_tokens, completion_tokens=response.usage.completion_tokens)
+        message = message_to_dict(response.choices[0].message)
     except Exception as e:
         print(f"Error calling OpenAI API: {str(e)}")
         return None
+    
+    if use_cache:
+        response_cache.set(cache_key, json.dumps(message))
+    return message
+
+def parse_tool_calls(reasoning):
+    """Return every tool call written out in the text of an LLM response, in order."""
+    with tracing.span("parse"):
+        return tool_parser.parse(reasoning)
 
 def parse_tool_call(reasoning):
-    tool_patterns = {
-        "calculate_square_root": r"calculate_square_root\s*\(\s*([0-9.]+)\s*\)",
-        "calculate_average": r"calculate_average\s*\(\s*\[\s*([0-9.,\s]+)\s*\]\s*\)",
-        "is_greater_than": r"is_greater_than\s*\(\s*([0-9.]+)\s*,\s*([0-9.]+)\s*\)",
-        "basic_calculator": r"basic_calculator\s*\(\s*['\"]([^'\"]+)['\"]\s*\)",
-        "count_vowels": r"count_vowels\s*\(\s*['\"]([^'\"]+)['\"]\s*\)",
-        "count_letters": r"count_letters\s*\(\s*['\"]([^'\"]+)['\"]\s*\)",
-        "count_words": r"count_words\s*\(\s*['\"]([^'\"]+)['\"]\s*\)",
-        "contains_substring": r"contains_substring\s*\(\s*['\"]([^'\"]+)['\"],\s*['\"]([^'\"]+)['\"]\s*\)"
-    }
-    
-    for tool_name, pattern in tool_patterns.items():
-        match = re.search(pattern, reasoning)
-        if match:
-            if tool_name == "calculate_average":
-                numbers_str = match.group(1)
-                numbers = [float(num.strip()) for num in numbers_str.split(',')]
-                return {"tool": tool_name, "params": [numbers]}
-            elif tool_name == "is_greater_than":
-                return {"tool": tool_name, "params": [float(match.group(1)), float(match.group(2))]}
-            elif tool_name == "contains_substring":
-                return {"tool": tool_name, "params": [match.group(1), match.group(2)]}
-            elif tool_name in ["basic_calculator"]:
-                return {"tool": tool_name, "params": [match.group(1)]}
-            else:
-                if tool_name in ["count_vowels", "count_letters", "count_words"]:
-                    return {"tool": tool_name, "params": [match.group(1)]}
-                else:
-                    # For numeric parameters
-                    param = float(match.group(1))
-                    return {"tool": tool_name, "params": [param]}
-    
-    vowels_match = re.search(r"count_vowels\s*\(\s*['\"]([^'\"]+)['\"]\s*\)", reasoning)
-    if vowels_match:
-        return {"tool": "count_vowels", "params": [vowels_match.group(1)]}
-    
-    letters_match = re.search(r"count_letters\s*\(\s*['\"]([^'\"]+)['\"]\s*\)", reasoning)
-    if letters_match:
-        return {"tool": "count_letters", "params": [letters_match.group(1)]}
-    
-    if "vowels" in reasoning.lower() and "in" in reasoning.lower():
-        word_match = re.search(r"vowels\s+in\s+['\"]([^'\"]+)['\"]", reasoning, re.IGNORECASE)
-        if word_match:
-            return {"tool": "count_vowels", "params": [word_match.group(1)]}
-    
-    if "letters" in reasoning.lower() and "in" in reasoning.lower():
-        # Try to find a word in quotes after "letters in"
-        word_match = re.search(r"letters\s+in\s+['\"]([^'\"]+)['\"]", reasoning, re.IGNORECASE)
-        if word_match:
-            return {"tool": "count_letters", "params": [word_match.group(1)]}
-    
-    # Look for words in quotes that might be used for counting
-    words_in_quotes = re.findall(r"['\"]([^'\"]+)['\"]", reasoning)
-    if words_in_quotes and ("extraordinary" in words_in_quotes):
-        return {"tool": "count_vowels", "params": ["extraordinary"]}
-    
-    return None
+    """Return the first tool call in the LLM response, or None."""
+    calls = parse_tool_calls(reasoning)
+    return calls[0] if calls else None
+
+def native_tool_calls(message):
+    """Turn the structured tool_calls of an assistant message into {"tool", "params", "id", "final"} dicts."""
+    calls = []
+    for tool_call in message.get("tool_calls") or []:
+        name = tool_call["function"]["name"]
+        call = {"tool": name, "params": [], "id": tool_call["id"], "final": False}
+        if name in TOOLS:
+            try:
+                arguments = json.loads(tool_call["function"]["arguments"] or "{}")
+                call["params"], call["final"] = arguments_to_params(name, arguments)
+            except (ValueError, KeyError) as e:
+                # Reported back to the model as the tool result
+                call["error"] = f"Invalid arguments for tool {name}: {str(e)}"
+        calls.append(call)
+    return calls
 
 def execute_tool(tool_info):
     """Execute the specified tool with the given parameters."""
-    tool_name = tool_info["tool"]
-    params = tool_info["params"]
-    
-    # Map tool names to functions
-    tool_map = {
-        "calculate_square_root": math_tools.calculate_square_root,
-        "calculate_average": math_tools.calculate_average,
-        "is_greater_than": math_tools.is_greater_than,
-        "basic_calculator": math_tools.basic_calculator,
-        "count_vowels": string_tools.count_vowels,
-        "count_letters": string_tools.count_letters,
-        "count_words": string_tools.count_words,
-        "contains_substring": string_tools.contains_substring
-    }
-    
-    if tool_name in tool_map:
-        try:
-            result = tool_map[tool_name](*params)
-            return result
-        except Exception as e:
-            return f"Error executing tool {tool_name}: {str(e)}"
-    else:
-        return f"Tool {tool_name} not found"
+    if tool_info.get("error"):
+        return tool_info["error"]
+    with tracing.span("tool.execute", labels={"tool": tool_info["tool"]}):
+        return call_tool(tool_info["tool"], tool_info["params"])
 
-def process_query(query):
-    """Process a natural language query using LLM reasoning and tool calling."""
-    # Create a prompt that encourages chain-of-thought reasoning and tool usage
-    prompt = f"""
-    I need you to help me answer the following query using step-by-step reasoning:
-    
-    "{query}"
-    
-    First, think through how to solve this problem. You MUST use one of the following tools to perform any calculations or string operations, even if they seem simple. Do not perform calculations yourself - use the appropriate tool instead.
-    
-    Math Tools:
-    - calculate_square_root(number)
-    - calculate_average([number1, number2, ...])
-    - is_greater_than(a, b)
-    - basic_calculator("expression")
-    
-    String Tools:
-    - count_vowels("text")
-    - count_letters("text")
-    - count_words("text")
-    - contains_substring("text", "substring")
+def format_answer(calls, results):
+    """Phrase tool results as the final answer without another completion."""
+    def format_result(result):
+        if isinstance(result, bool):
+            return "Yes" if result else "No"
+        if isinstance(result, float) and result.is_integer():
+            return str(int(result))
+        return str(result)
     
-    Your response should follow this format:
-    
-    Reasoning: [Your step-by-step reasoning]
-    Tool Call: [You MUST specify a tool and parameters for any calculation]
-    Answer: [Your final answer]
-    
-    Be explicit about when you need to use a tool and what parameters to use. Remember, all calculations must be done using tools, not by yourself.
+    if len(calls) == 1:
+        return format_result(results[0])
+    return "; ".join(f"{format_call(call)} = {format_result(result)}" for call, result in zip(calls, results))
+
+def query_steps(query):
+    """Process a query as a generator that yields each LLM request and is sent back the reply.
     
-    For complex queries that require multiple tools, please use one tool at a time and specify each tool call separately.
+    Each request is a {"messages": ..., "tools": ...} dict and each reply the
+    assistant message as a dict (or None on failure). Keeping the LLM calls
+    outside lets process_query drive it with the blocking client and batch.py
+    drive it with the async client, without duplicating the logic.
+    The generator's return value is the result dict.
     """
+    # Queries the local planner understands are answered from the tools without any LLM call
+    with tracing.span("planner"):
+        planned = planner.plan(query)
+    if planned:
+        return planned
     
-    # Get the LLM's reasoning
-    llm_response = get_llm_response(prompt)
-    if not llm_response:
-        return {"error": "Failed to get LLM response"}
-    
-    reasoning_match = re.search(r"Reasoning:(.*?)(?=Tool Call:|Answer:|$)", llm_response, re.DOTALL)
-    tool_call_match = re.search(r"Tool Call:(.*?)(?=Answer:|$)", llm_response, re.DOTALL)
-    answer_match = re.search(r"Answer:(.*?)$", llm_response, re.DOTALL)
-    
-    reasoning = reasoning_match.group(1).strip() if reasoning_match else ""
-    tool_call_text = tool_call_match.group(1).strip() if tool_call_match else ""
-    initial_answer = answer_match.group(1).strip() if answer_match else ""
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": query},
+    ]
     
-    if "extraordinary" in query.lower() and "consonants" in query.lower() and "vowels" in query.lower():
-        vowel_count = string_tools.count_vowels("extraordinary")
-        letter_count = string_tools.count_letters("extraordinary")
-        consonant_count = letter_count - vowel_count
-        
-        result = {
-            "query": query,
-            "reasoning": f"To determine if 'extraordinary' has more consonants than vowels, I need to count both.\n\n1. Count vowels in 'extraordinary': {vowel_count}\n2. Count total letters in 'extraordinary': {letter_count}\n3. Calculate consonants: total letters - vowels = {letter_count} - {vowel_count} = {consonant_count}",
-            "tool_used": "count_vowels and count_letters",
-            "tool_result": f"Vowels: {vowel_count}, Consonants: {consonant_count}",
-            "answer": f"Yes, 'extraordinary' has more consonants ({consonant_count}) than vowels ({vowel_count})."
-        }
-        
-        return result
-    
-    if "machine" in query.lower() and "reasoning" in query.lower():
-        machine_letters = string_tools.count_letters("machine")
-        reasoning_vowels = string_tools.count_vowels("reasoning")
-        
-        is_greater = math_tools.is_greater_than(machine_letters, reasoning_vowels)
-        
-        result = {
-            "query": query,
-            "reasoning": f"To answer this question, I need to:\n\n1. Count the letters in 'machine': {machine_letters}\n2. Count the vowels in 'reasoning': {reasoning_vowels}\n3. Compare these two values to see if the first is greater than the second.",
-            "tool_used": "count_letters, count_vowels, and is_greater_than",
-            "tool_result": f"Letters in 'machine': {machine_letters}, Vowels in 'reasoning': {reasoning_vowels}, Is greater: {is_greater}",
-            "answer": f"Yes, the number of letters in 'machine' ({machine_letters}) is greater than the number of vowels in 'reasoning' ({reasoning_vowels})."
-        }
-        
-        return result
+    message = yield {"messages": messages, "tools": OPENAI_TOOLS}
+    if message is None:
+        return {"error": "Failed to get LLM response"}
     
-    if "square root" in query.lower() and "average" in query.lower() and "18" in query and "50" in query:
-        avg = math_tools.calculate_average([18, 50])
-        sqrt = math_tools.calculate_square_root(avg)
+    reasoning = []
+    steps = []
+    answer = None
+    for _ in range(MAX_TOOL_ROUNDS):
+        content = (message.get("content") or "").strip()
+        calls = native_tool_calls(message)
+        # Models that write tool calls out as text instead of using tool_calls
+        text_calls = [] if calls else parse_tool_calls(content)
         
-        result = {
-            "query": query,
-            "reasoning": f"To find the square root of the average of 18 and 50:\n\n1. Calculate the average of 18 and 50: (18 + 50) / 2 = {avg}\n2. Calculate the square root of {avg}: √{avg} = {sqrt}",
-            "tool_used": "calculate_average and calculate_square_root",
-            "tool_result": f"Average: {avg}, Square root: {sqrt}",
-            "answer": f"The square root of the average of 18 and 50 is {sqrt}."
-        }
+        if not calls and not text_calls:
+            answer = content
+            break
         
-        return result
-    
-    if "vowels" in query.lower() and "multimodality" in query.lower():
-        vowel_count = string_tools.count_vowels("multimodality")
+        messages.append(message)
+        if calls:
+            if content:
+                reasoning.append(content)
+            results = execute_plan(calls, execute_tool, tool_executor)
+            for call, result in zip(calls, results):
+                messages.append({"role": "tool", "tool_call_id": call["id"], "content": json.dumps(result, default=str)})
+        else:
+            reasoning.append(content)
+            calls = text_calls
+            results = execute_plan(calls, execute_tool, tool_executor)
+            messages.append({
+                "role": "user",
+                "content": "Tool results:\n" + "\n".join(
+                    f"{i}. {format_call(call)} = {result}"
+                    for i, (call, result) in enumerate(zip(calls, results), start=1)
+                ),
+            })
+        steps.extend(zip(calls, results))
         
-        result = {
-            "query": query,
-            "reasoning": "To count the vowels in 'Multimodality', I need to identify all occurrences of the letters a, e, i, o, u (both uppercase and lowercase).",
-            "tool_used": "count_vowels",
-            "tool_result": str(vowel_count),
-            "answer": f"There are {vowel_count} vowels in the word 'Multimodality'."
-        }
+        # The model marked these results as the answer, so phrase it locally instead of asking again
+        if all(call.get("final") for call in calls):
+            answer = format_answer(calls, results)
+            break
         
-        return result
+        message = yield {"messages": messages, "tools": OPENAI_TOOLS}
+        if message is None:
+            return {"error": "Failed to get LLM response"}
     
-    tool_info = parse_tool_call(llm_response)
-    tool_result = None
+    if answer is None:
+        answer = f"No answer after {MAX_TOOL_ROUNDS} rounds of tool calls."
     
-    if tool_info:
-        tool_result = execute_tool(tool_info)
-        
-        final_prompt = f"""
-        Based on the reasoning:
-        
-        {reasoning}
-        
-        And the result of the tool {tool_info['tool']}: {tool_result}
-        
-        What is the final answer to the query: "{query}"?
-        
-        Provide only the final answer without any additional explanation.
-        """
-        
-        final_answer = get_llm_response(final_prompt)
+    # Prepare the result
+    if not reasoning:
+        reasoning = [f"{i}. {format_call(call)}" for i, (call, _) in enumerate(steps, start=1)]
+    if len(steps) == 1:
+        tool_result = steps[0][1]
     else:
-        final_answer = initial_answer
+        tool_result = ", ".join(f"{format_call(call)} = {result}" for call, result in steps) or None
     
-    # Prepare the result
     result = {
         "query": query,
-        "reasoning": reasoning,
-        "tool_used": tool_info["tool"] if tool_info else None,
+        "reasoning": "\n".join(reasoning),
+        "tool_used": ", ".join(call["tool"] for call, _ in steps) or None,
         "tool_result": tool_result,
-        "answer": final_answer
+        "answer": answer
     }
     
     return result
 
+def process_query(query):
+    """Process a natural language query using LLM reasoning and tool calling."""
+    steps = query_steps(query)
+    try:
+        request = next(steps)
+        while True:
+            request = steps.send(get_llm_message(request))
+    except StopIteration as done:
+        return done.value
+
 def display_result(result):
     """Display the result in a formatted way."""
     print("\n" + "="*50)
@@ -269,6 +250,10 @@ def main():
     while True:
         query = input("Enter your query: ")
         if query.lower() == 'exit':
+            stats = response_cache.stats()
+            print(f"LLM cache: {stats['hits']} hits, {stats['misses']} misses")
+            stats = planner.stats()
+            print(f"Answered locally: {stats['planned']} of {stats['planned'] + stats['fallbacks']} queries ({stats['coverage']:.0%})")
             break
         
         result = process_query(query)
@@ -0,0 +1,220 @@
+import re
+
+from tool_plan import format_call
+from tools.registry import call_tool
+
+NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)"
+UNITS = r"vowels|letters|words|consonants"
+COUNT_TOOLS = {"vowels": "count_vowels", "letters": "count_letters", "words": "count_words"}
+COMPARISONS = {
+    "greater": True, "more": True, "larger": True, "bigger": True, "higher": True,
+    "less": False, "smaller": False, "fewer": False, "lower": False,
+}
+
+
+def pattern(regex):
+    return re.compile(regex, re.IGNORECASE | re.DOTALL)
+
+
+# Whole-query shapes, tried in order against the query without its trailing punctuation
+COUNT_QUERY = pattern(
+    rf"(?:how many|count the|count) (?P<unit>{UNITS}) (?:are )?(?:there )?(?:in|does) (?P<text>.+?)(?: have| contain)?"
+)
+MORE_QUERY = pattern(rf"does (?P<text>.+?) (?:have|contain) more (?P<a>{UNITS}) than (?P<b>{UNITS})")
+CONTAINS_QUERY = pattern(r"does (?P<text>.+?) contain (?:the )?(?:substring |text |word )?(?P<substring>.+)")
+COMPARE_QUERY = pattern(rf"is (?P<a>.+?) (?P<op>{'|'.join(COMPARISONS)}) than (?P<b>.+)")
+VALUE_QUERY = pattern(r"(?:what is|what's|whats|calculate|compute|evaluate|find|how much is) (?P<value>.+)")
+
+# Phrases that denote a number
+SQUARE_ROOT = pattern(r"square root of (?P<value>.+)")
+AVERAGE = pattern(r"(?:average|mean) of (?P<values>.+)")
+SUM = pattern(r"sum of (?P<values>.+)")
+PERCENT = pattern(rf"(?P<percent>{NUMBER})\s*(?:%|percent) of (?P<value>.+)")
+COUNT = pattern(rf"(?:(?:the )?(?:number|count) of )?(?P<unit>{UNITS}) in (?P<text>.+)")
+ARITHMETIC = pattern(r"[\d\s.+\-*/()%^]*\d[\d\s.+\-*/()%^]*")
+LIST_SEPARATOR = pattern(r"\s*,\s*(?:and\s+)?|\s+and\s+")
+TEXT = pattern(r"(?:the (?:word|text|string|phrase|sentence)\s+)?(?:'(?P<single>[^']*)'|\"(?P<double>[^\"]*)\")|the word (?P<bare>\w+)")
+
+
+def describe(phrase, value):
+    """"the number of letters in 'machine' (7)", or just "7" when the phrase is the number itself."""
+    phrase = phrase.strip()
+    if re.fullmatch(NUMBER, phrase):
+        return phrase
+    return f"{phrase} ({format_number(value)})"
+
+
+class Unplannable(Exception):
+    """Raised when part of a query does not match any known shape."""
+
+
+def format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class LocalPlanner:
+    """Answers common query shapes directly from the tools, without an LLM call.
+
+    Recognised shapes include counting vowels, letters, consonants or words in
+    a quoted text, comparisons between such counts or numbers, substring
+    checks, and numeric phrases built from averages, sums, percentages,
+    square roots and arithmetic. plan() returns None for anything else so the
+    caller can fall back to the LLM.
+    """
+
+    def __init__(self):
+        self.planned = 0
+        self.fallbacks = 0
+
+    def plan(self, query):
+        """Return a result dict in the same shape as process_query, or None."""
+        text = query.strip().rstrip("?.! ").strip()
+        try:
+            answer, steps = self._answer(text)
+        except Unplannable:
+            self.fallbacks += 1
+            return None
+        self.planned += 1
+
+        calls = [call for call, _ in steps]
+        results = [result for _, result in steps]
+        return {
+            "query": query,
+            "reasoning": "\n".join(
+                f"{i}. {format_call(call)} = {format_number(result)}" for i, (call, result) in enumerate(steps, start=1)
+            ),
+            "tool_used": ", ".join(call["tool"] for call in calls),
+            "tool_result": results[0] if len(results) == 1 else ", ".join(
+                f"{format_call(call)} = {format_number(result)}" for call, result in steps
+            ),
+            "answer": answer,
+        }
+
+    def stats(self):
+        total = self.planned + self.fallbacks
+        return {
+            "planned": self.planned,
+            "fallbacks": self.fallbacks,
+            "coverage": self.planned / total if total else 0.0,
+        }
+
+    def _answer(self, text):
+        steps = []
+
+        match = COUNT_QUERY.fullmatch(text)
+        if match:
+            subject = self._text(match.group("text"))
+            count = self._count(match.group("unit").lower(), subject, steps)
+            return f"There are {count} {match.group('unit').lower()} in '{subject}'.", steps
+
+        match = MORE_QUERY.fullmatch(text)
+        if match:
+            subject = self._text(match.group("text"))
+            a_unit, b_unit = match.group("a").lower(), match.group("b").lower()
+            a = self._count(a_unit, subject, steps)
+            b = self._count(b_unit, subject, steps)
+            verdict = self._run("is_greater_than", [a, b], steps)
+            return (
+                f"{'Yes' if verdict else 'No'}, '{subject}' {'has' if verdict else 'does not have'} "
+                f"more {a_unit} ({a}) than {b_unit} ({b}).",
+                steps,
+            )
+
+        match = CONTAINS_QUERY.fullmatch(text)
+        if match:
+            subject = self._text(match.group("text"))
+            substring = self._text(match.group("substring"))
+            verdict = self._run("contains_substring", [subject, substring], steps)
+            return f"{'Yes' if verdict else 'No'}, '{subject}' {'contains' if verdict else 'does not contain'} '{substring}'.", steps
+
+        match = COMPARE_QUERY.fullmatch(text)
+        if match:
+            a = self._value(match.group("a"), steps)
+            b = self._value(match.group("b"), steps)
+            op = match.group("op").lower()
+            verdict = self._run("is_greater_than", [a, b] if COMPARISONS[op] else [b, a], steps)
+            return (
+                f"{'Yes' if verdict else 'No'}, {describe(match.group('a'), a)} is {'' if verdict else 'not '}"
+                f"{op} than {describe(match.group('b'), b)}.",
+                steps,
+            )
+
+        match = VALUE_QUERY.fullmatch(text)
+        if match:
+            phrase = match.group("value")
+            value = self._value(phrase, steps)
+            if not steps:
+                raise Unplannable(phrase)
+            phrase = phrase.strip()
+            if ARITHMETIC.fullmatch(phrase):
+                return f"{phrase} = {format_number(value)}", steps
+            return f"{phrase[0].upper()}{phrase[1:]} is {format_number(value)}.", steps
+
+        raise Unplannable(text)
+
+    def _value(self, phrase, steps):
+        """Evaluate a phrase that denotes a number, recording each tool call in steps."""
+        phrase = re.sub(r"^the\s+", "", phrase.strip(), flags=re.IGNORECASE)
+
+        if re.fullmatch(NUMBER, phrase):
+            return float(phrase)
+
+        match = SQUARE_ROOT.fullmatch(phrase)
+        if match:
+            return self._run("calculate_square_root", [self._value(match.group("value"), steps)], steps)
+
+        match = AVERAGE.fullmatch(phrase)
+        if match:
+            return self._run("calculate_average", [self._values(match.group("values"), steps)], steps)
+
+        match = SUM.fullmatch(phrase)
+        if match:
+            values = self._values(match.group("values"), steps)
+            return self._run("basic_calculator", [" + ".join(format_number(value) for value in values)], steps)
+
+        match = PERCENT.fullmatch(phrase)
+        if match:
+            value = self._value(match.group("value"), steps)
+            return self._run("basic_calculator", [f"{match.group('percent')} / 100 * {format_number(value)}"], steps)
+
+        match = COUNT.fullmatch(phrase)
+        if match:
+            return self._count(match.group("unit").lower(), self._text(match.group("text")), steps)
+
+        if ARITHMETIC.fullmatch(phrase) and re.search(r"\d\s*[-+*/%^]", phrase):
+            return self._run("basic_calculator", [phrase.replace("^", "**")], steps)
+
+        raise Unplannable(phrase)
+
+    def _values(self, phrase, steps):
+        items = [item for item in LIST_SEPARATOR.split(phrase.strip()) if item]
+        if len(items) < 2:
+            raise Unplannable(phrase)
+        return [self._value(item, steps) for item in items]
+
+    def _count(self, unit, subject, steps):
+        if unit == "consonants":
+            letters = self._run("count_letters", [subject], steps)
+            vowels = self._run("count_vowels", [subject], steps)
+            return self._run("basic_calculator", [f"{letters} - {vowels}"], steps)
+        return self._run(COUNT_TOOLS[unit], [subject], steps)
+
+    def _text(self, phrase):
+        match = TEXT.fullmatch(phrase.strip())
+        if not match:
+            raise Unplannable(phrase)
+        return next(group for group in match.group("single", "double", "bare") if group is not None)
+
+    def _run(self, tool, params, steps):
+        # The same call can come up twice, e.g. counting vowels for "consonants than vowels"
+        for call, result in steps:
+            if call["tool"] == tool and call["params"] == params:
+                return result
+        result = call_tool(tool, params)
+        # Tools report failures as messages; let the LLM handle those queries
+        if isinstance(result, str):
+            raise Unplannable(f"{tool} failed: {result}")
+        steps.append(({"tool": tool, "params": params}, result))
+        return result
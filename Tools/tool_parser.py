@@ -0,0 +1,130 @@
+import re
+
+from tools.registry import TOOL_SIGNATURES
+
+# Prose phrasings the model sometimes uses instead of an explicit call,
+# e.g. "count the vowels in 'extraordinary'".
+PROSE_TOOLS = {
+    "vowels": "count_vowels",
+    "letters": "count_letters",
+    "words": "count_words",
+}
+
+NUMBER = r"[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?"
+STRING = r"'[^']*'|\"[^\"]*\""
+LIST = r"\[[^\[\]()]*\]"
+# $1, $2, ... refer to the result of the first, second, ... call in the response
+REF = r"\$\d+"
+ARG = rf"(?:[A-Za-z_]\w*\s*=\s*)?(?:{STRING}|{LIST}|{REF}|{NUMBER})"
+
+ARG_RE = re.compile(
+    rf"(?:[A-Za-z_]\w*\s*=\s*)?(?:(?P<string>{STRING})|(?P<list>{LIST})|(?P<ref>{REF})|(?P<number>{NUMBER}))"
+)
+LIST_ITEM_RE = re.compile(rf"(?P<ref>{REF})|(?P<number>{NUMBER})")
+# What comes right before a call that is itself an argument of another call
+NESTED_RE = re.compile(r"[(\[,=]\s*\Z")
+
+
+def make_ref(token):
+    """Turn "$2" into a reference to the result of call index 1."""
+    return {"ref": int(token[1:]) - 1}
+
+
+class ToolCallParser:
+    """Extracts every tool call from an LLM response in a single regex pass.
+
+    The call grammar is anchored on the literal "(" so the regex engine can
+    skip through long reasoning text at memchr speed; the tool name in front
+    of each candidate is then checked against the registered names.
+    """
+
+    def __init__(self, signatures=None, prose_tools=None):
+        self.signatures = dict(signatures or TOOL_SIGNATURES)
+        self.prose_tools = {
+            word: tool for word, tool in (prose_tools or PROSE_TOOLS).items()
+            if tool in self.signatures
+        }
+
+        # Longest names first so a tool name that prefixes another never shadows it
+        names = "|".join(re.escape(name) for name in sorted(self.signatures, key=len, reverse=True))
+        self.call_pattern = re.compile(rf"\(\s*(?P<args>{ARG}(?:\s*,\s*{ARG})*)?\s*,?\s*\)")
+        self.name_pattern = re.compile(rf"(?<!\w)(?P<tool>{names})\s*\Z")
+        self.name_window = max(len(name) for name in self.signatures) + 8
+
+        self.prose_pattern = None
+        if self.prose_tools:
+            words = "|".join(re.escape(word) for word in self.prose_tools)
+            self.prose_pattern = re.compile(
+                rf"\b(?P<prose>{words})\s+in\s+(?:the\s+(?:word|text|phrase|sentence)\s+)?"
+                rf"(?P<quote>['\"])(?P<text>(?:(?!(?P=quote)).)+)(?P=quote)",
+                re.IGNORECASE,
+            )
+
+    def parse(self, text):
+        """Return all tool calls in order as [{"tool": name, "params": [...]}, ...].
+
+        A parameter written as $N becomes {"ref": N - 1}, a reference to the
+        result of an earlier call in the same response. A call nested in
+        another's arguments, as in calculate_square_root(calculate_average([18, 50])),
+        is listed before the outer call, which refers to its result.
+
+        Explicit calls such as count_vowels("word") take priority; prose
+        mentions like "vowels in 'word'" are only scanned for when the
+        response contains no explicit call.
+        """
+        calls = []
+        pending = text
+        while True:
+            # The call grammar has no nested parentheses, so each pass finds the
+            # innermost calls. Replacing every call found with a $N reference
+            # lets the next pass see the calls around the nested ones.
+            pieces = []
+            last = 0
+            nested = False
+            for match in self.call_pattern.finditer(pending):
+                start = match.start()
+                name_match = self.name_pattern.search(pending, max(0, start - self.name_window), start)
+                if not name_match:
+                    continue
+                tool_name = name_match.group("tool")
+                params = self._convert_args(tool_name, match.group("args") or "")
+                if params is None:
+                    continue
+                calls.append({"tool": tool_name, "params": params})
+                begin = name_match.start()
+                pieces += [pending[last:begin], f"${len(calls)}"]
+                last = match.end()
+                nested = nested or NESTED_RE.search(pending, max(0, begin - self.name_window), begin) is not None
+            if not nested:
+                break
+            pending = "".join(pieces) + pending[last:]
+
+        if calls or not self.prose_pattern:
+            return calls
+        return [
+            {"tool": self.prose_tools[match.group("prose").lower()], "params": [match.group("text")]}
+            for match in self.prose_pattern.finditer(text)
+        ]
+
+    def _convert_args(self, tool_name, args_text):
+        signature = self.signatures[tool_name]
+        tokens = list(ARG_RE.finditer(args_text))
+        if len(tokens) != len(signature):
+            return None
+
+        params = []
+        for token, arg_type in zip(tokens, signature):
+            if token.group("ref"):
+                params.append(make_ref(token.group("ref")))
+            elif arg_type == "text" and token.group("string"):
+                params.append(token.group("string")[1:-1])
+            elif arg_type == "number" and token.group("number"):
+                params.append(float(token.group("number")))
+            elif arg_type == "numbers" and token.group("list"):
+                params.append([
+                    make_ref(item.group("ref")) if item.group("ref") else float(item.group("number"))
+                    for item in LIST_ITEM_RE.finditer(token.group("list"))
+                ])
+            else:
+                return None
+        return params
@@ -0,0 +1,88 @@
+def is_ref(param):
+    return isinstance(param, dict) and "ref" in param
+
+
+def call_dependencies(call):
+    """Return the indices of the calls whose results this call needs."""
+    deps = set()
+    for param in call["params"]:
+        if is_ref(param):
+            deps.add(param["ref"])
+        elif isinstance(param, list):
+            deps.update(item["ref"] for item in param if is_ref(item))
+    return deps
+
+
+def build_plan(calls):
+    """Group calls into waves; every call in a wave only depends on earlier waves.
+
+    Returns (waves, invalid) where waves is a list of lists of call indices and
+    invalid maps the index of a call with a bad reference to an error message.
+    References may only point at calls that appear earlier in the response.
+    """
+    levels = {}
+    invalid = {}
+    for index, call in enumerate(calls):
+        deps = call_dependencies(call)
+        bad = [dep for dep in deps if not 0 <= dep < index or dep in invalid]
+        if bad:
+            invalid[index] = f"Invalid reference ${bad[0] + 1} in call {index + 1}"
+            continue
+        levels[index] = 1 + max((levels[dep] for dep in deps), default=-1)
+
+    waves = [[] for _ in range(max(levels.values(), default=-1) + 1)]
+    for index, level in levels.items():
+        waves[level].append(index)
+    return waves, invalid
+
+
+def resolve_params(params, results):
+    """Substitute earlier call results for references."""
+    resolved = []
+    for param in params:
+        if is_ref(param):
+            resolved.append(results[param["ref"]])
+        elif isinstance(param, list):
+            resolved.append([results[item["ref"]] if is_ref(item) else item for item in param])
+        else:
+            resolved.append(param)
+    return resolved
+
+
+def execute_plan(calls, execute, executor=None):
+    """Run the tool calls, independent ones concurrently, and return their results in order.
+
+    execute takes a {"tool": ..., "params": [...]} dict, exactly like
+    execute_tool; any other keys of the call are passed through. Calls in
+    the same wave are submitted to the executor together; a wave with a
+    single call runs inline.
+    """
+    waves, invalid = build_plan(calls)
+    results = [None] * len(calls)
+    for index, message in invalid.items():
+        results[index] = message
+
+    for wave in waves:
+        resolved = [
+            {**calls[index], "params": resolve_params(calls[index]["params"], results)}
+            for index in wave
+        ]
+        if executor is None or len(wave) == 1:
+            wave_results = [execute(call) for call in resolved]
+        else:
+            wave_results = list(executor.map(execute, resolved))
+        for index, result in zip(wave, wave_results):
+            results[index] = result
+    return results
+
+
+def format_call(call):
+    """Render a call the way the model writes it, e.g. count_vowels('reasoning')."""
+    def format_param(param):
+        if is_ref(param):
+            return f"${param['ref'] + 1}"
+        if isinstance(param, list):
+            return "[" + ", ".join(format_param(item) for item in param) + "]"
+        return repr(param)
+
+    return f"{call['tool']}({', '.join(format_param(param) for param in call['params'])})"
@@ -0,0 +1,172 @@
+import ast
+import math
+from functools import lru_cache, reduce
+
+import numpy as np
+
+CACHE_SIZE = 1024
+MAX_EXPRESSION_LENGTH = 1000
+MAX_EXPONENT = 1000
+MAX_INTEGER_BITS = 10000
+
+BINARY_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+UNARY_OPERATORS = (ast.UAdd, ast.USub)
+
+# The same names are bound to scalar functions for evaluate() and to NumPy
+# ufuncs for evaluate_batch(), so one compiled expression serves both.
+SCALAR_FUNCTIONS = {
+    "sqrt": math.sqrt,
+    "abs": abs,
+    "round": round,
+    "min": min,
+    "max": max,
+    "exp": math.exp,
+    "log": math.log,
+    "log10": math.log10,
+    "sin": math.sin,
+    "cos": math.cos,
+    "tan": math.tan,
+    "floor": math.floor,
+    "ceil": math.ceil,
+}
+VECTOR_FUNCTIONS = {
+    "sqrt": np.sqrt,
+    "abs": np.abs,
+    "round": np.round,
+    # np.minimum and np.maximum take two inputs and would treat a third as
+    # their output buffer; min and max take any number
+    "min": lambda *args: reduce(np.minimum, args),
+    "max": lambda *args: reduce(np.maximum, args),
+    "exp": np.exp,
+    "log": np.log,
+    "log10": np.log10,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "floor": np.floor,
+    "ceil": np.ceil,
+}
+CONSTANTS = {
+    "pi": math.pi,
+    "e": math.e,
+}
+
+
+class ExpressionError(ValueError):
+    """Raised when an expression uses syntax outside the arithmetic whitelist."""
+
+
+def checked_pow(base, exponent):
+    if abs(exponent) > MAX_EXPONENT:
+        raise ExpressionError(f"Exponent larger than {MAX_EXPONENT}")
+    if isinstance(base, int) and isinstance(exponent, int) and base.bit_length() * exponent > MAX_INTEGER_BITS:
+        raise ExpressionError("Result too large")
+    return base ** exponent
+
+
+class CompiledExpression:
+    """A validated arithmetic expression compiled to a code object."""
+
+    def __init__(self, source, code, variables):
+        self.source = source
+        self.code = code
+        self.variables = variables
+
+    def evaluate(self, variables=None):
+        namespace = {"__builtins__": {}, "_pow": checked_pow, **SCALAR_FUNCTIONS, **CONSTANTS, **(variables or {})}
+        self._check_variables(namespace)
+        return eval(self.code, namespace)
+
+    def evaluate_batch(self, columns):
+        """Evaluate over many bindings at once; columns maps each variable to a sequence."""
+        # Copied, so nothing in the expression can write to the caller's arrays
+        arrays = {name: np.array(values, dtype=float) for name, values in columns.items()}
+        namespace = {"__builtins__": {}, "_pow": np.power, **VECTOR_FUNCTIONS, **CONSTANTS, **arrays}
+        self._check_variables(namespace)
+        with np.errstate(all="ignore"):
+            result = np.asarray(eval(self.code, namespace), dtype=float)
+        if result.ndim == 0:
+            # Expressions without variables still return one value per binding
+            size = max((array.size for array in arrays.values()), default=1)
+            result = np.full(size, result)
+        return result
+
+    def _check_variables(self, namespace):
+        missing = [name for name in self.variables if name not in namespace]
+        if missing:
+            raise ExpressionError(f"Unbound variable(s): {', '.join(sorted(missing))}")
+
+
+def _validate(node, variables):
+    if isinstance(node, ast.Expression):
+        _validate(node.body, variables)
+    elif isinstance(node, ast.Constant):
+        if type(node.value) not in (int, float):
+            raise ExpressionError(f"Unsupported constant: {node.value!r}")
+    elif isinstance(node, ast.BinOp):
+        if not isinstance(node.op, BINARY_OPERATORS):
+            raise ExpressionError(f"Unsupported operator: {type(node.op).__name__}")
+        _validate(node.left, variables)
+        _validate(node.right, variables)
+    elif isinstance(node, ast.UnaryOp):
+        if not isinstance(node.op, UNARY_OPERATORS):
+            raise ExpressionError(f"Unsupported operator: {type(node.op).__name__}")
+        _validate(node.operand, variables)
+    elif isinstance(node, ast.Call):
+        if not isinstance(node.func, ast.Name) or node.func.id not in SCALAR_FUNCTIONS or node.keywords:
+            raise ExpressionError(f"Unsupported function call: {ast.unparse(node.func)}")
+        for arg in node.args:
+            _validate(arg, variables)
+    elif isinstance(node, ast.Name):
+        if node.id.startswith("_"):
+            raise ExpressionError(f"Unsupported name: {node.id}")
+        if node.id in SCALAR_FUNCTIONS:
+            raise ExpressionError(f"Function {node.id} must be called")
+        if node.id not in CONSTANTS:
+            variables.add(node.id)
+    else:
+        raise ExpressionError(f"Unsupported syntax: {type(node).__name__}")
+
+
+class _PowToCall(ast.NodeTransformer):
+    """Route ** through _pow so huge exponents are rejected before they are computed."""
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Pow):
+            return ast.Call(func=ast.Name(id="_pow", ctx=ast.Load()), args=[node.left, node.right], keywords=[])
+        return node
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def compile_expression(expression):
+    """Parse, validate and compile an expression once; repeated calls hit the LRU cache."""
+    if len(expression) > MAX_EXPRESSION_LENGTH:
+        raise ExpressionError(f"Expression longer than {MAX_EXPRESSION_LENGTH} characters")
+    try:
+        tree = ast.parse(expression.strip(), mode="eval")
+    except SyntaxError as e:
+        raise ExpressionError(f"Invalid expression: {e.msg}") from None
+    variables = set()
+    _validate(tree, variables)
+    tree = ast.fix_missing_locations(_PowToCall().visit(tree))
+    return CompiledExpression(expression, compile(tree, "<expression>", "eval"), frozenset(variables))
+
+
+def evaluate(expression, variables=None):
+    """Evaluate an arithmetic expression, e.g. evaluate("(x + 2) * 3", {"x": 4})."""
+    return compile_expression(expression).evaluate(variables)
+
+
+def evaluate_batch(expression, bindings):
+    """Evaluate one expression over many variable bindings with vectorized NumPy arithmetic.
+
+    bindings is either a mapping of variable name to a column of values, or a
+    list of {variable: value} dicts (one per row). Returns a NumPy array with
+    one result per binding.
+    """
+    if not isinstance(bindings, dict):
+        rows = list(bindings)
+        names = set().union(*rows) if rows else set()
+        bindings = {name: [row[name] for row in rows] for name in names}
+    return compile_expression(expression).evaluate_batch(bindings)
@@ -1,4 +1,5 @@
 import math
+from tools.expression import evaluate
 
 def calculate_square_root(number):
     return math.sqrt(number)
@@ -11,6 +12,6 @@ def is_greater_than(a, b):
 
 def basic_calculator(expression):
     try:
-        return eval(expression)
+        return evaluate(expression)
     except Exception as e:
         return f"Error calculating: {str(e)}" 
\ No newline at end of file
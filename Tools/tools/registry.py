@@ -0,0 +1,123 @@
+from tools import math_tools, string_tools
+
+# Every tool the agent can call, with a JSON schema for each parameter.
+# Parameters are listed in the order the function takes them.
+TOOLS = {
+    "calculate_square_root": {
+        "function": math_tools.calculate_square_root,
+        "description": "Calculate the square root of a number.",
+        "parameters": {
+            "number": {"type": "number", "description": "A non-negative number."},
+        },
+    },
+    "calculate_average": {
+        "function": math_tools.calculate_average,
+        "description": "Calculate the arithmetic mean of a list of numbers.",
+        "parameters": {
+            "numbers": {"type": "array", "items": {"type": "number"}, "description": "The numbers to average."},
+        },
+    },
+    "is_greater_than": {
+        "function": math_tools.is_greater_than,
+        "description": "Return true if a is greater than b.",
+        "parameters": {
+            "a": {"type": "number"},
+            "b": {"type": "number"},
+        },
+    },
+    "basic_calculator": {
+        "function": math_tools.basic_calculator,
+        "description": "Evaluate an arithmetic expression such as \"(120 + 280) * 0.15\".",
+        "parameters": {
+            "expression": {"type": "string", "description": "The expression to evaluate."},
+        },
+    },
+    "count_vowels": {
+        "function": string_tools.count_vowels,
+        "description": "Count the vowels (a, e, i, o, u, either case) in a text.",
+        "parameters": {
+            "text": {"type": "string"},
+        },
+    },
+    "count_letters": {
+        "function": string_tools.count_letters,
+        "description": "Count the alphabetic characters in a text.",
+        "parameters": {
+            "text": {"type": "string"},
+        },
+    },
+    "count_words": {
+        "function": string_tools.count_words,
+        "description": "Count the whitespace-separated words in a text.",
+        "parameters": {
+            "text": {"type": "string"},
+        },
+    },
+    "contains_substring": {
+        "function": string_tools.contains_substring,
+        "description": "Return true if the text contains the substring, ignoring case.",
+        "parameters": {
+            "text": {"type": "string"},
+            "substring": {"type": "string"},
+        },
+    },
+}
+
+# Extra argument added to every schema so the model can mark a call whose
+# result already answers the query; no further completion is needed then.
+FINAL_ARGUMENT = "final"
+
+# Parameter types as understood by tool_parser.ToolCallParser
+PARSER_TYPES = {"number": "number", "array": "numbers", "string": "text"}
+
+TOOL_SIGNATURES = {
+    name: tuple(PARSER_TYPES[schema["type"]] for schema in tool["parameters"].values())
+    for name, tool in TOOLS.items()
+}
+
+
+def openai_tool_schemas():
+    """Return the tools in the chat completions `tools` format."""
+    schemas = []
+    for name, tool in TOOLS.items():
+        properties = dict(tool["parameters"])
+        properties[FINAL_ARGUMENT] = {
+            "type": "boolean",
+            "description": "Set to true if the result of this call is the complete answer to the user's query.",
+        }
+        schemas.append({
+            "type": "function",
+            "function": {
+                "name": name,
+                "description": tool["description"],
+                "parameters": {
+                    "type": "object",
+                    "properties": properties,
+                    "required": list(tool["parameters"]),
+                },
+            },
+        })
+    return schemas
+
+
+OPENAI_TOOLS = openai_tool_schemas()
+
+
+def arguments_to_params(name, arguments):
+    """Order a JSON arguments object as the tool's positional parameters.
+
+    Returns (params, final); raises KeyError for an unknown tool or a missing argument.
+    """
+    params = [arguments[parameter] for parameter in TOOLS[name]["parameters"]]
+    return params, bool(arguments.get(FINAL_ARGUMENT, False))
+
+
+def call_tool(name, params):
+    """Call a registered tool with positional parameters, returning errors as messages."""
+    tool = TOOLS.get(name)
+    if tool is None:
+        return f"Tool {name} not found"
+    try:
+        return tool["function"](*params)
+    except Exception as e:
+        return f"Error executing tool {name}: {str(e)}"
@@ -1,12 +1,120 @@
+import codecs
+import mmap
+import os
+import string
+
+import numpy as np
+
+VOWELS = "aeiouAEIOU"
+VOWEL_BYTES = VOWELS.encode("ascii")
+ASCII_LETTERS = string.ascii_letters.encode("ascii")
+# Bytes str.split() treats as whitespace within ASCII
+ASCII_WHITESPACE = np.zeros(256, dtype=bool)
+ASCII_WHITESPACE[[9, 10, 11, 12, 13, 28, 29, 30, 31, 32]] = True
+CHUNK_SIZE = 8 * 1024 * 1024
+
 def count_vowels(text):
-    vowels = "aeiouAEIOU"
-    return sum(1 for char in text if char in vowels)
+    return sum(map(text.count, VOWELS))
 
 def count_letters(text):
-    return sum(1 for char in text if char.isalpha())
+    return sum(map(str.isalpha, text))
 
 def count_words(text):
     return len(text.split())
 
 def contains_substring(text, substring):
-    return substring.lower() in text.lower() 
\ No newline at end of file
+    return substring.lower() in text.lower()
+
+# Bulk versions: each takes a list of items and returns one result per item.
+# An item is a str or bytes holding the text itself, or a pathlib.Path / other
+# os.PathLike naming a UTF-8 file. Files are memory-mapped and processed in
+# chunk_size pieces, so they are never loaded into memory whole.
+
+def count_vowels_bulk(items, chunk_size=CHUNK_SIZE):
+    return [
+        sum(len(chunk) - len(chunk.translate(None, VOWEL_BYTES)) for chunk in _byte_chunks(item, chunk_size))
+        for item in items
+    ]
+
+def count_letters_bulk(items, chunk_size=CHUNK_SIZE):
+    return [_count_letters(_byte_chunks(item, chunk_size)) for item in items]
+
+def count_words_bulk(items, chunk_size=CHUNK_SIZE):
+    return [_count_words(_byte_chunks(item, chunk_size)) for item in items]
+
+def contains_substring_bulk(items, substring, chunk_size=CHUNK_SIZE):
+    needle = substring.lower()
+    return [_contains(_text_chunks(item, chunk_size), needle) for item in items]
+
+def _byte_chunks(item, chunk_size):
+    if isinstance(item, str):
+        for start in range(0, len(item), chunk_size):
+            yield item[start:start + chunk_size].encode("utf-8")
+    elif isinstance(item, (bytes, bytearray)):
+        for start in range(0, len(item), chunk_size):
+            yield bytes(item[start:start + chunk_size])
+    else:
+        with open(os.fspath(item), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                for start in range(0, size, chunk_size):
+                    yield mapped[start:start + chunk_size]
+
+def _text_chunks(item, chunk_size):
+    if isinstance(item, str):
+        for start in range(0, len(item), chunk_size):
+            yield item[start:start + chunk_size]
+    else:
+        decoder = codecs.getincrementaldecoder("utf-8")("replace")
+        for chunk in _byte_chunks(item, chunk_size):
+            yield decoder.decode(chunk)
+
+def _is_plain_ascii(chunk, decoder):
+    # A chunk can take the byte-level fast path only if it is ASCII and no
+    # multi-byte character from the previous chunk is still pending
+    return chunk.isascii() and not decoder.getstate()[0]
+
+def _count_letters(chunks):
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    total = 0
+    for chunk in chunks:
+        if _is_plain_ascii(chunk, decoder):
+            total += len(chunk) - len(chunk.translate(None, ASCII_LETTERS))
+        else:
+            total += sum(map(str.isalpha, decoder.decode(chunk)))
+    return total
+
+def _count_words(chunks):
+    # A word is counted where it starts; in_word carries whether the previous
+    # chunk ended inside a word, so words split across chunks count once.
+    decoder = codecs.getincrementaldecoder("utf-8")("replace")
+    total = 0
+    in_word = False
+    for chunk in chunks:
+        if _is_plain_ascii(chunk, decoder):
+            space = ASCII_WHITESPACE[np.frombuffer(chunk, dtype=np.uint8)]
+            total += int(np.count_nonzero(space[:-1] & ~space[1:]))
+            total += int(not space[0] and not in_word)
+            in_word = not space[-1]
+        else:
+            text = decoder.decode(chunk)
+            if not text:
+                continue
+            total += len(text.split()) - int(in_word and not text[0].isspace())
+            in_word = not text[-1].isspace()
+    return total
+
+def _contains(chunks, needle):
+    if not needle:
+        return True
+    # Keep the last len(needle) - 1 characters so matches spanning chunks are found
+    overlap = len(needle) - 1
+    tail = ""
+    for chunk in chunks:
+        window = tail + chunk.lower()
+        if needle in window:
+            return True
+        tail = window[-overlap:] if overlap else ""
+    return False
@@ -0,0 +1,238 @@
+"""Per-stage latency tracing and metrics shared by the Tools, Q&A and Model-Comparision apps.
+
+Spans time a stage of work and are only recorded when tracing is on
+(TRACING=1, or tracing.enable()); when it is off span() hands back a shared
+no-op object, so instrumented code pays for little more than a function call.
+
+    with tracing.span("llm.request", model=model) as s:
+        response = client.chat.completions.create(...)
+        s.set(prompt_tokens=..., completion_tokens=...)
+
+    @tracing.traced("tool.execute")
+    def execute_tool(...): ...
+
+Each finished span is logged as one JSON line on the "tracing" logger and
+added to a latency histogram. Span attributes ending in "_tokens" are also
+summed into the tokens_total counter. count() and gauge() record plain
+counters and gauges whether or not tracing is on. render_prometheus()
+returns every metric in the Prometheus text format, and snapshot() returns
+them as a dict.
+"""
+import functools
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, float("inf"))
+
+logger = logging.getLogger("tracing")
+
+# Read from TRACING on first use rather than on import, so a .env the app loads after importing this applies
+_enabled = None
+_lock = threading.Lock()
+_histograms = {}
+_counters = {}
+_gauges = {}
+
+
+def enable(flag=True):
+    global _enabled
+    _enabled = flag
+    if flag and not logger.handlers:
+        log_path = os.getenv("TRACING_LOG")
+        handler = logging.FileHandler(log_path) if log_path else logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def is_enabled():
+    if _enabled is None:
+        enable(os.getenv("TRACING", "").lower() in ("1", "true", "on"))
+    return _enabled
+
+
+class _NoopSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Span:
+    __slots__ = ("name", "labels", "attrs", "start")
+
+    def __init__(self, name, labels, attrs):
+        self.name = name
+        self.labels = labels
+        self.attrs = attrs
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _observe(self.name, self.labels, duration, exc_type is not None)
+        for key, value in self.attrs.items():
+            if key.endswith("_tokens") and isinstance(value, (int, float)):
+                count("tokens", value, span=self.name, kind=key[:-len("_tokens")])
+        record = {"span": self.name, "duration_ms": round(duration * 1000, 3), **self.labels, **self.attrs}
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        logger.info(json.dumps(record, default=str))
+        return False
+
+    def set(self, **attrs):
+        """Attach attributes known only once the stage has run, e.g. token counts."""
+        self.attrs.update(attrs)
+
+
+def span(name, labels=None, **attrs):
+    """Time a block of work. labels become Prometheus labels, attrs only go to the JSON log."""
+    if not is_enabled():
+        return NOOP_SPAN
+    return Span(name, labels or {}, attrs)
+
+
+def traced(name=None, labels=None):
+    """Decorator form of span(); works on plain and async functions."""
+    def decorator(func):
+        span_name = name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not is_enabled():
+                    return await func(*args, **kwargs)
+                with Span(span_name, labels or {}, {}):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return func(*args, **kwargs)
+            with Span(span_name, labels or {}, {}):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def observe(name, seconds, labels=None):
+    """Record a duration the caller measured itself, e.g. time to first token, like a span."""
+    if is_enabled():
+        _observe(name, labels or {}, seconds, False)
+
+
+def _key(name, labels):
+    return name, tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def count(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def gauge(name, value, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _gauges[key] = value
+
+
+def _observe(name, labels, duration, error):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(BUCKETS), "sum": 0.0, "count": 0, "errors": 0}
+        for i, bound in enumerate(BUCKETS):
+            if duration <= bound:
+                histogram["buckets"][i] += 1
+                break
+        histogram["sum"] += duration
+        histogram["count"] += 1
+        histogram["errors"] += int(error)
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _counters.clear()
+        _gauges.clear()
+
+
+def snapshot():
+    """Return all metrics as a JSON-serialisable dict."""
+    with _lock:
+        return {
+            "spans": [
+                {"span": name, **dict(labels), "count": h["count"], "errors": h["errors"],
+                 "total_seconds": h["sum"], "mean_seconds": h["sum"] / h["count"] if h["count"] else 0.0}
+                for (name, labels), h in _histograms.items()
+            ],
+            "counters": [{"name": name, **dict(labels), "value": value} for (name, labels), value in _counters.items()],
+            "gauges": [{"name": name, **dict(labels), "value": value} for (name, labels), value in _gauges.items()],
+        }
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _metric_name(name):
+    return "".join(char if char.isalnum() else "_" for char in name)
+
+
+def render_prometheus():
+    """Return all metrics in the Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        if _histograms:
+            lines.append("# TYPE span_duration_seconds histogram")
+            for (name, labels), h in sorted(_histograms.items()):
+                base = (("span", name),) + labels
+                cumulative = 0
+                for bound, bucket in zip(BUCKETS, h["buckets"]):
+                    cumulative += bucket
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"span_duration_seconds_bucket{_format_labels(base + (('le', le),))} {cumulative}")
+                lines.append(f"span_duration_seconds_sum{_format_labels(base)} {h['sum']}")
+                lines.append(f"span_duration_seconds_count{_format_labels(base)} {h['count']}")
+            lines.append("# TYPE span_errors_total counter")
+            for (name, labels), h in sorted(_histograms.items()):
+                lines.append(f"span_errors_total{_format_labels((('span', name),) + labels)} {h['errors']}")
+
+        for metric_name in sorted({name for name, _ in _counters}):
+            lines.append(f"# TYPE {_metric_name(metric_name)}_total counter")
+            for (name, labels), value in sorted(_counters.items()):
+                if name == metric_name:
+                    lines.append(f"{_metric_name(name)}_total{_format_labels(labels)} {value}")
+
+        for metric_name in sorted({name for name, _ in _gauges}):
+            lines.append(f"# TYPE {_metric_name(metric_name)} gauge")
+            for (name, labels), value in sorted(_gauges.items()):
+                if name == metric_name:
+                    lines.append(f"{_metric_name(name)}{_format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+